@@ -0,0 +1,202 @@
+# ann_index.py — choose and build the faiss index type for a set of vectors
+#
+# Specs are written as "<kind>[:key=value,...]", e.g. "flat", "hnsw:m=32",
+# "ivf:nlist=1024,nprobe=32", "ivfpq:pq_m=48" or "auto". The resolved spec
+# is stored in the index metadata ("index_spec") so searches after a reload
+# use the same nprobe / efSearch the index was built with.
+#
+# codec sets how flat, IVF and HNSW indexes store vectors: "f32" as they
+# are, "fp16" (half the size, no measurable recall loss) or "sq8" (one byte
+# per dimension, a quarter of the size), e.g. "flat:codec=sq8".
+
+import os
+from dataclasses import asdict, dataclass, fields, replace
+
+import numpy as np
+
+
+DEFAULT_INDEX_SPEC = os.getenv("INDEX_SPEC", "auto")
+
+# "auto" picks exact search for small corpora and ANN once it stops scaling
+AUTO_FLAT_MAX = 20_000
+AUTO_IVF_MAX = 500_000
+
+KINDS = ("flat", "ivf", "hnsw", "ivfpq", "auto")
+CODECS = ("f32", "fp16", "sq8")
+# Codec used when a spec does not name one
+VECTOR_CODEC = os.getenv("VECTOR_CODEC", "f32")
+
+
+@dataclass
+class IndexSpec:
+    kind: str = "auto"
+    nlist: int = 0        # IVF: number of centroids (0 = about 4 * sqrt(n))
+    nprobe: int = 0       # IVF: lists visited per query (0 = nlist / 16, at least 8)
+    m: int = 32           # HNSW: neighbours per node
+    ef_construction: int = 80
+    ef_search: int = 64
+    pq_m: int = 0         # IVF-PQ: sub-quantizers (0 = dim / 8); must divide dim
+    pq_bits: int = 8
+    codec: str = ""       # f32 / fp16 / sq8 ("" = VECTOR_CODEC); IVF-PQ is always "pq"
+
+    @classmethod
+    def parse(cls, spec):
+        if isinstance(spec, IndexSpec):
+            return spec
+        if isinstance(spec, dict):
+            known = {f.name for f in fields(cls)}
+            return cls(**{k: v for k, v in spec.items() if k in known})
+
+        kind, _, params = (spec or "auto").partition(":")
+        kind = kind.strip().lower()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown index kind {kind!r}; expected one of {', '.join(KINDS)}")
+
+        values = {}
+        for item in filter(None, params.split(",")):
+            key, _, value = item.partition("=")
+            value = value.strip()
+            values[key.strip()] = int(value) if value.lstrip("-").isdigit() else value.lower()
+        return cls(kind=kind, **values)
+
+    def resolve(self, n, dim):
+        """
+        Fill in "auto" and zero defaults for n vectors of size dim.
+        """
+        spec = self
+        codec = spec.codec or VECTOR_CODEC
+        if codec not in CODECS + ("pq",):
+            raise ValueError(f"Unknown vector codec {codec!r}; expected one of {', '.join(CODECS)}")
+        spec = replace(spec, codec=codec)
+
+        if spec.kind == "auto":
+            if n <= AUTO_FLAT_MAX:
+                kind = "flat"
+            elif n <= AUTO_IVF_MAX:
+                kind = "ivf"
+            else:
+                kind = "ivfpq"
+            spec = replace(spec, kind=kind)
+
+        if spec.kind in ("ivf", "ivfpq"):
+            # faiss wants ~39 training points per centroid
+            nlist = spec.nlist or int(4 * np.sqrt(n))
+            nlist = max(1, min(nlist, n // 39 or 1))
+            nprobe = spec.nprobe or max(8, nlist // 16)
+            spec = replace(spec, nlist=nlist, nprobe=min(nprobe, nlist))
+
+        if spec.kind == "ivfpq":
+            pq_m = spec.pq_m or max(1, dim // 8)
+            while dim % pq_m:
+                pq_m -= 1
+            # PQ training needs 2**bits points per sub-quantizer centroid set
+            pq_bits = spec.pq_bits
+            while pq_bits > 4 and n < 2 ** pq_bits * 4:
+                pq_bits -= 1
+            spec = replace(spec, pq_m=pq_m, pq_bits=pq_bits, codec="pq")
+
+        return spec
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def build_index(vectors, spec=None):
+    """
+    Build (and train, if needed) a faiss index over vectors.
+    Returns (index, resolved IndexSpec).
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    spec = IndexSpec.parse(spec or DEFAULT_INDEX_SPEC).resolve(n, dim)
+
+    if n == 0:
+        spec = replace(spec, kind="flat", codec="f32")
+    qtype = _scalar_quantizer_type(spec.codec)
+
+    if spec.kind == "flat":
+        if qtype is None:
+            index = faiss.IndexFlatL2(dim)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+    elif spec.kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, spec.m) if qtype is None else faiss.IndexHNSWSQ(dim, qtype, spec.m)
+        index.hnsw.efConstruction = spec.ef_construction
+    elif spec.kind == "ivf":
+        if qtype is None:
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, spec.nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                faiss.IndexFlatL2(dim), dim, spec.nlist, qtype, faiss.METRIC_L2
+            )
+    else:
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, spec.nlist, spec.pq_m, spec.pq_bits)
+
+    if not index.is_trained:
+        index.train(vectors)
+    if n:
+        index.add(vectors)
+
+    apply_search_settings(index, spec)
+    return index, spec
+
+
+def _scalar_quantizer_type(codec):
+    # None = store float32 vectors as they are
+    import faiss
+
+    return {
+        "fp16": faiss.ScalarQuantizer.QT_fp16,
+        "sq8": faiss.ScalarQuantizer.QT_8bit,
+    }.get(codec)
+
+
+def apply_search_settings(index, spec):
+    spec = IndexSpec.parse(spec)
+    if spec.kind in ("ivf", "ivfpq"):
+        index.nprobe = spec.nprobe
+    elif spec.kind == "hnsw":
+        index.hnsw.efSearch = spec.ef_search
+
+
+def search_parameters(index, spec, selector):
+    """
+    faiss SearchParameters carrying an ID selector. IVF and HNSW need
+    their own subclass, and it must repeat nprobe / efSearch, which
+    would otherwise fall back to faiss' defaults.
+    """
+    import faiss
+
+    spec = IndexSpec.parse(spec)
+    if spec.kind in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=spec.nprobe)
+    if spec.kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=spec.ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+
+def reconstruct_rows(index, spec, rows):
+    """
+    Stored vectors of the given rows (approximate for IVF-PQ and the
+    fp16 / sq8 codecs).
+    """
+    import faiss
+
+    rows = np.asarray(rows, dtype=np.int64)
+    if IndexSpec.parse(spec).kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_batch(rows)
+
+
+def reconstruct_all(index, spec):
+    """
+    Stored vectors as an (n, dim) matrix. Exact for f32 flat/HNSW/IVF,
+    approximate for IVF-PQ and the fp16 / sq8 codecs (the codes are lossy).
+    """
+    import faiss
+
+    if IndexSpec.parse(spec).kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
@@ -0,0 +1,94 @@
+# answer_batch.py — answer a file of questions against one case index
+#
+# Usage:
+#   python answer_batch.py questions.jsonl --index outputs/case_collection \
+#       [--doc-id "HBR Case Study.pdf"] [--out answers.jsonl] [--workers 4] [--mode single]
+#
+# Each input line is a JSON object with the question under "question"
+# (or "query" / "body"), plus any other fields, e.g. an "id"; those are
+# copied to the output. Plain JSON strings work too. Output lines are
+# written as soon as each answer completes, so they are not in input order;
+# "line" gives the input line number.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from rag_pipeline import PIPELINE_MODES, answer_queries, get_response_cache
+from query_cache import query_memo_stats, semantic_cache_stats
+from context_packer import packing_stats
+from reranker import USE_RERANK, rerank_stats
+
+
+QUESTION_FIELDS = ("question", "query", "body")
+
+
+def read_questions(path):
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            question = next((record[k] for k in QUESTION_FIELDS if record.get(k)), None)
+            if question is None:
+                raise ValueError(f"{path}:{line_no}: no {' / '.join(QUESTION_FIELDS)} field")
+            records.append((line_no, question, record))
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions against one index.")
+    parser.add_argument("questions", help="JSONL file of questions.")
+    parser.add_argument("--index", default=os.path.join("outputs", "case_collection"),
+                        help="Index or collection directory.")
+    parser.add_argument("--doc-id", action="append", dest="doc_ids",
+                        help="Only search this document of the collection (repeatable).")
+    parser.add_argument("--out", help="Output JSONL (default: stdout).")
+    parser.add_argument("--workers", type=int, help="Questions answered in parallel.")
+    parser.add_argument("--mode", choices=PIPELINE_MODES)
+    args = parser.parse_args(argv)
+
+    records = read_questions(args.questions)
+    questions = [question for _, question, _ in records]
+    print(f"⏳ Answering {len(questions)} questions ({len(set(questions))} unique)", file=sys.stderr)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    start = time.perf_counter()
+    try:
+        for done, (i, answer, docs) in enumerate(
+            answer_queries(args.index, questions, args.doc_ids, args.mode, args.workers), start=1
+        ):
+            line_no, _, record = records[i]
+            result = dict(record)
+            result.update({
+                "line": line_no,
+                "answer": answer,
+                "sources": list(dict.fromkeys(d.metadata["doc_id"] for d in docs if "doc_id" in d.metadata)),
+                "chunks": len(docs),
+            })
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if done % 10 == 0:
+                print(f"  {done}/{len(questions)} answered", file=sys.stderr)
+    finally:
+        if args.out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✔ {len(questions)} answers in {elapsed:.1f}s", file=sys.stderr)
+    print("✔ LLM cache:", get_response_cache().stats(), file=sys.stderr)
+    print("✔ Semantic cache:", semantic_cache_stats(), file=sys.stderr)
+    print("✔ Query embedding memo:", query_memo_stats(), file=sys.stderr)
+    print("✔ Context packing:", packing_stats(), file=sys.stderr)
+    if USE_RERANK:
+        print("✔ Retrieval stages (ms per question):", rerank_stats(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
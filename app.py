@@ -5,16 +5,24 @@ import streamlit as st
 from typing import Optional
 
 # --- Import RAG components (assuming they are in the same environment) ---
-from pdf_reader import extract_pdf_text
-from embedder import chunk_text, embed_and_build_index, save_index
-from rag_pipeline import answer_query
-from utils import get_file_size # Assuming utils.py is available
+from embedder import (
+    delete_from_collection, open_collection, migrate_legacy_indexes, get_embedding_model, COLLECTION_DIR_NAME,
+)
+from indexing_jobs import get_indexing_queue
+from rag_pipeline import answer_query_stream, get_gemini_model, get_response_cache
+from diversity import mmr_stats
+from query_cache import query_memo_stats, semantic_cache_stats
+from context_packer import packing_stats
+from reranker import USE_RERANK, rerank_stats
+from utils import get_file_size, save_stream # Assuming utils.py is available
 import time
 
 # --- Configuration ---
 APP_TITLE = "🔬 AI-Powered Case Study Analyst"
 SAMPLE_DIR = "sample_cases"
 OUTPUT_DIR = "outputs"
+# One vector collection holds every indexed case; each PDF is a document in it
+COLLECTION_PATH = os.path.join(OUTPUT_DIR, COLLECTION_DIR_NAME)
 
 # Ensure directories exist
 os.makedirs(SAMPLE_DIR, exist_ok=True)
@@ -23,9 +31,11 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # --- Utility Functions ---
 
 def get_available_files():
-    """Fetches available PDFs and Indexes, returning names and paths."""
+    """Fetches available PDFs and the indexed cases (PDF names) in the collection."""
     existing_pdfs = [f for f in os.listdir(SAMPLE_DIR) if f.lower().endswith(".pdf")]
-    available_indexes = [f for f in os.listdir(OUTPUT_DIR) if f.endswith("_index.pkl")]
+    # Old per-case indexes (.pkl or directories) are moved into the collection on sight
+    migrate_legacy_indexes(OUTPUT_DIR, COLLECTION_PATH)
+    available_indexes = open_collection(COLLECTION_PATH).documents()
     return existing_pdfs, available_indexes
 
 def delete_file_and_index(filename: str):
@@ -37,12 +47,10 @@ def delete_file_and_index(filename: str):
         os.remove(pdf_path)
         st.toast(f"🗑️ Deleted PDF: {filename}", icon="✅")
     
-    # 2. Delete Vector Index file
-    index_filename = filename.replace(".pdf", "_index.pkl")
-    index_path = os.path.join(OUTPUT_DIR, index_filename)
-    if os.path.exists(index_path):
-        os.remove(index_path)
-        st.toast(f"🗑️ Deleted Index: {index_filename}", icon="✅")
+    # 2. Remove its vectors from the collection (tombstoned now, compacted in the background)
+    if filename in open_collection(COLLECTION_PATH).documents():
+        delete_from_collection(COLLECTION_PATH, filename)
+        st.toast(f"🗑️ Deleted Index: {filename}", icon="✅")
     
     # Reset session state if the deleted file was the one currently selected
     if st.session_state["current_pdf_name"] == filename:
@@ -54,42 +62,81 @@ def delete_file_and_index(filename: str):
     st.rerun()
 
 def handle_upload_and_indexing(uploaded_file):
-    """Handles saving the file, processing text, chunking, and indexing."""
+    """Saves the file and queues it for indexing in the background."""
     
-    # 1. Save PDF
+    # 1. Save PDF: copied to disk in blocks and hashed on the way
     save_path = os.path.join(SAMPLE_DIR, uploaded_file.name)
-    with open(save_path, "wb") as f:
-        f.write(uploaded_file.read())
-
+    part_path = save_path + ".part"
+    source_hash = save_stream(uploaded_file, part_path)
+
+    # The content hash is the index identity: known content is not indexed again
+    existing = open_collection(COLLECTION_PATH).find_source(source_hash)
+    if existing is not None:
+        if existing == uploaded_file.name:
+            os.replace(part_path, save_path)
+        else:
+            os.remove(part_path)
+        st.session_state["current_index_path"] = COLLECTION_PATH
+        st.session_state["current_pdf_name"] = existing
+        st.toast(f"Already indexed as {existing}, skipping.", icon="♻️")
+        return
+
+    os.replace(part_path, save_path)
     st.toast(f"File saved: {uploaded_file.name}", icon="💾")
 
-    # 2. Extract and Index
-    process_bar = st.progress(0, text="Starting text extraction...")
-    
-    try:
-        raw_text = extract_pdf_text(save_path)
-        process_bar.progress(33, text="Extraction complete. Generating text chunks...")
-        
-        chunks = chunk_text(raw_text)
-        st.info(f"📄 Successfully created **{len(chunks)}** text chunks for indexing.")
-        process_bar.progress(66, text="Chunks generated. Building FAISS Vector Index...")
-
-        db = embed_and_build_index(chunks)
-
-        index_filename = uploaded_file.name.replace(".pdf", "_index.pkl")
-        index_path = os.path.join(OUTPUT_DIR, index_filename)
-        save_index(db, index_path)
-
-        st.session_state["current_index_path"] = index_path
-        st.session_state["current_pdf_name"] = uploaded_file.name
-        
-        process_bar.progress(100, text="Indexing Complete! Ready to analyze.")
-        st.success(f"🎉 Case Study **{uploaded_file.name}** is ready to be queried!")
+    # 2. Extract and Index on the shared worker pool; this session only polls it.
+    # The job reads the saved file directly.
+    job = get_indexing_queue().submit(COLLECTION_PATH, uploaded_file.name, save_path, source_hash)
+    jobs = st.session_state.setdefault("indexing_jobs", [])
+    if job.key not in jobs:
+        jobs.append(job.key)
+
+def show_indexing_progress():
+    """Draws progress of this session's indexing jobs; reruns the app when one finishes."""
+    keys = st.session_state.get("indexing_jobs", [])
+    queue = get_indexing_queue()
+    finished = False
+
+    for key in list(keys):
+        job = queue.get(key)
+        if job is None:
+            keys.remove(key)
+            continue
+
+        info = job.snapshot()
+        if info["status"] in ("done", "failed"):
+            keys.remove(key)
+            st.session_state.setdefault("indexing_results", []).append(info)
+            finished = True
+        else:
+            st.progress(info["progress"], text=f"**{info['doc_id']}**: {info['stage']}")
+
+    if finished:
+        st.rerun()
+
+def show_indexing_results():
+    """Reports jobs that finished since the last run (once each)."""
+    for info in st.session_state.pop("indexing_results", []):
+        if info["status"] == "failed":
+            st.error(f"An error occurred during processing of {info['doc_id']}: {info['error']}")
+            continue
+
+        stats = info["stats"]
+        st.info(f"📄 Successfully created **{info['chunks_total']}** text chunks for indexing.")
+        st.info(
+            f"⚡ Embedded {stats['chunks']} chunks in {stats['seconds']}s "
+            f"({stats['chunks_per_sec']} chunks/sec), {stats['cached']} reused from cache, "
+            f"{stats.get('duplicates', 0)} near-duplicates skipped."
+        )
+        st.session_state["current_index_path"] = COLLECTION_PATH
+        st.session_state["current_pdf_name"] = info["doc_id"]
+        st.success(f"🎉 Case Study **{info['doc_id']}** is ready to be queried!")
         st.balloons()
-        
-    except Exception as e:
-        process_bar.empty()
-        st.error(f"An error occurred during processing: {e}")
+
+@st.cache_resource(show_spinner="Loading models...")
+def load_shared_models():
+    """Builds the embedding model and Gemini client once per server process, shared by all sessions."""
+    return get_embedding_model(), get_gemini_model()
 
 # --- Streamlit UI Components ---
 
@@ -249,8 +296,7 @@ def show_sidebar_status(existing_pdfs, available_indexes):
     # Index Files Status
     st.sidebar.markdown("#### **Available Vector Indexes**")
     if available_indexes:
-        for f_index in available_indexes:
-            f_pdf = f_index.replace("_index.pkl", ".pdf")
+        for f_pdf in available_indexes:
             
             # Index deletion is now handled by PDF deletion, but we can show status
             cols = st.sidebar.columns([0.8, 0.2])
@@ -262,11 +308,61 @@ def show_sidebar_status(existing_pdfs, available_indexes):
     else:
         st.sidebar.warning("No Vector Indexes ready. Please upload and process a case.")
 
+    # LLM response cache status (hit rate is since this server process started)
+    cache_stats = get_response_cache().stats()
+    st.sidebar.caption(
+        f"🧠 LLM response cache: {cache_stats['entries']} answers stored, "
+        f"hit rate {cache_stats['hit_rate']:.0%}"
+    )
+    diversity_stats = mmr_stats()
+    st.sidebar.caption(
+        f"🧩 MMR diversification replaced {diversity_stats['replaced']} near-redundant chunks "
+        f"over {diversity_stats['searches']} searches"
+    )
+    semantic_stats, memo_stats = semantic_cache_stats(), query_memo_stats()
+    st.sidebar.caption(
+        f"🔁 Semantic answer cache: {semantic_stats['entries']} answers, "
+        f"hit rate {semantic_stats['hit_rate']:.0%} · "
+        f"query embeddings reused {memo_stats['hit_rate']:.0%}"
+    )
+    pack_stats = packing_stats()
+    st.sidebar.caption(
+        f"✂️ Context packing saved {pack_stats['tokens_saved']:,} prompt tokens "
+        f"over {pack_stats['queries']} prompts ({pack_stats['merged']} overlapping chunks merged)"
+    )
+    if USE_RERANK:
+        stage_stats = rerank_stats()
+        st.sidebar.caption(
+            f"🎯 Retrieval per question: recall {stage_stats['recall_ms']:.0f} ms "
+            f"({stage_stats['candidates']:.0f} candidates), rerank {stage_stats['rerank_ms']:.0f} ms"
+        )
+
+
+def show_source_chunks(docs):
+    """Expander listing the retrieved RAG chunks."""
+    with st.expander("🔎 View Retrieved Source Context (RAG Chunks)", expanded=False):
+        if docs:
+            st.markdown(f"**{len(docs)}** relevant chunks retrieved from the source document.")
+            for i, d in enumerate(docs):
+                # Citation from the chunk metadata, when the index recorded it
+                page = d.metadata.get("page")
+                if page is None:
+                    st.markdown(f"##### Chunk {i+1}")
+                elif d.metadata.get("end_page", page) != page:
+                    st.markdown(f"##### Chunk {i+1} · pages {page}–{d.metadata['end_page']}")
+                else:
+                    st.markdown(f"##### Chunk {i+1} · page {page}")
+                # Use st.code for better readability of text chunks
+                st.code(d.page_content, language='text') 
+        else:
+            st.info("No source documents were retrieved for this query.")
+
 
 # --- Main App Logic ---
 
 def main():
     setup_page()
+    load_shared_models()
     
     # Initialize session state variables
     if "current_index_path" not in st.session_state:
@@ -306,9 +402,15 @@ def main():
                     use_container_width=True
                 ):
                     handle_upload_and_indexing(uploaded)
-                    # Rerun to update the index list immediately
+                    # Rerun to start polling the job
                     st.rerun() 
 
+            show_indexing_results()
+            if st.session_state.get("indexing_jobs"):
+                # Polls once a second without rerunning the rest of the page,
+                # so questions can still be asked while a case is indexing
+                st.fragment(show_indexing_progress, run_every=1)()
+
     # ----------------------------------------------------
     # COLUMN 2: QUERYING & ANSWER (Step 2 & 3)
     # ----------------------------------------------------
@@ -326,7 +428,7 @@ def main():
                 
                 # Pre-select the HBR Case Study if available (retains previous behavior)
                 default_index = 0
-                hbr_index_name = "HBR Case Study_index.pkl"
+                hbr_index_name = "HBR Case Study.pdf"
                 if hbr_index_name in available_indexes:
                     default_index = available_indexes.index(hbr_index_name)
                     
@@ -337,9 +439,9 @@ def main():
                     key="index_selector",
                     label_visibility="collapsed"
                 )
-                index_path = os.path.join(OUTPUT_DIR, choice)
+                index_path = COLLECTION_PATH
                 st.session_state["current_index_path"] = index_path
-                st.session_state["current_pdf_name"] = choice.replace("_index.pkl", ".pdf")
+                st.session_state["current_pdf_name"] = choice
                 
                 st.success(f"Case Selected: **{st.session_state['current_pdf_name']}** is ready for analysis.")
                 
@@ -353,18 +455,27 @@ def main():
             # --- RAG Execution ---
             # Now only runs if query_to_run is NOT None (i.e., user submitted a chat message)
             if query_to_run and index_path:
-                with st.spinner(f"Analyzing case study: {st.session_state['current_pdf_name']}..."):
-                    # Clear previous results before running new query
-                    st.session_state['last_answer'] = None 
-                    st.session_state['last_docs'] = None
-                    st.session_state['last_query'] = query_to_run
-                    
-                    answer, docs = answer_query(index_path, query_to_run)
+                # Clear previous results before running new query
+                st.session_state['last_answer'] = None 
+                st.session_state['last_docs'] = None
+                st.session_state['last_query'] = query_to_run
+
+                with st.spinner(f"Searching case study: {st.session_state['current_pdf_name']}..."):
+                    docs, answer_stream = answer_query_stream(
+                        index_path, query_to_run, doc_ids=[st.session_state['current_pdf_name']]
+                    )
+
+                st.markdown("---")
+                st.subheader(f"⏳ **Answering:** *{query_to_run}*")
+                # Sources are ready before the answer, so show them first
+                show_source_chunks(docs)
+                # Tokens render as Gemini produces them
+                answer = st.write_stream(answer_stream)
 
-                    # Store result in session state
-                    st.session_state['last_answer'] = answer
-                    st.session_state['last_docs'] = docs
-                    st.rerun() # Trigger a rerun to display results clearly below
+                # Store result in session state
+                st.session_state['last_answer'] = answer
+                st.session_state['last_docs'] = docs
+                st.rerun() # Trigger a rerun to display results clearly below
 
             # --- Result Display ---
             if 'last_answer' in st.session_state and st.session_state['last_answer'] is not None:
@@ -388,15 +499,7 @@ def main():
 
                 # Context Details Expander
                 st.markdown("---")
-                with st.expander("🔎 View Retrieved Source Context (RAG Chunks)", expanded=False):
-                    if st.session_state['last_docs']:
-                        st.markdown(f"**{len(st.session_state['last_docs'])}** relevant chunks retrieved from the source document.")
-                        for i, d in enumerate(st.session_state['last_docs']):
-                            st.markdown(f"##### Chunk {i+1}")
-                            # Use st.code for better readability of text chunks
-                            st.code(d.page_content, language='text') 
-                    else:
-                        st.info("No source documents were retrieved for this query.")
+                show_source_chunks(st.session_state['last_docs'])
                         
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,602 @@
+# benchmark.py — performance checks for the RAG pipeline
+#
+# Usage:
+#   python benchmark.py importtime [--repeat 5] [--out importtime.json] [--max-ms 500]
+#   python benchmark.py clean [--mb 20] [--min-mbps 20]
+#   python benchmark.py chunk [--mb 20]
+#   python benchmark.py ann [--n 100000] [--specs flat ivf hnsw ivfpq]
+#   python benchmark.py pipeline [--questions 20] [--modes two_pass single case_summary]
+#   python benchmark.py embed [--backends torch onnx onnx-int8] [--chunks 512] [--queries 100]
+#   python benchmark.py memory [--chunks 2000] [--codecs f32 fp16 sq8]
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _write_json(path, data):
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        print("✔ Results written to", path)
+
+
+# ----------------------------------------------------
+# IMPORT TIME
+# ----------------------------------------------------
+IMPORT_MODULES = ["pdf_reader", "embedder", "index_store", "rag_pipeline"]
+
+
+def measure_import_ms(module: str) -> float:
+    """
+    Cumulative import cost of `module` in a fresh interpreter (python -X importtime).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        # Nested imports are indented; the top-level module has a single space
+        if len(parts) == 3 and parts[2] == " " + module:
+            return int(parts[1]) / 1000.0
+    raise RuntimeError(f"No importtime entry for {module}")
+
+
+def bench_importtime(args):
+    results = {}
+    print(f"{'module':<16}{'median ms':>12}{'min ms':>10}")
+    for module in args.modules:
+        runs = [measure_import_ms(module) for _ in range(args.repeat)]
+        results[module] = {"median_ms": round(statistics.median(runs), 1), "min_ms": round(min(runs), 1)}
+        print(f"{module:<16}{results[module]['median_ms']:>12}{results[module]['min_ms']:>10}")
+
+    _write_json(args.out, results)
+
+    if args.max_ms:
+        slow = [m for m, r in results.items() if r["median_ms"] > args.max_ms]
+        if slow:
+            print(f"❌ Over the {args.max_ms} ms budget:", ", ".join(slow))
+            return 1
+    return 0
+
+
+# ----------------------------------------------------
+# TEXT CLEANING
+# ----------------------------------------------------
+def _reference_clean_text(text):
+    # The original multi-pass clean_text, kept to check output and speed-up
+    text = text.encode("ascii", "ignore").decode()
+    text = re.sub(r"[ \t]+", " ", text)
+    cleaned = []
+    for line in text.split("\n"):
+        if not re.match(r"^\s*\d+\s*$", line.strip()):
+            cleaned.append(line.strip())
+    text = "\n".join(cleaned)
+    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    return text.strip()
+
+
+def synthetic_pages(total_mb: float, seed: int = 0):
+    """
+    Page texts shaped like pdfplumber layout output: padded columns,
+    page-number lines, blank runs and the odd non-ASCII character.
+    """
+    rng = random.Random(seed)
+    words = ("exclusivity revenue Ferrari brand margin strategy “quoted” café "
+             "dealer supply chain 2025 growth luxury customers").split()
+    pages, size, page_no = [], 0, 0
+    while size < total_mb * 1_000_000:
+        page_no += 1
+        lines = []
+        for _ in range(55):
+            r = rng.random()
+            if r < 0.1:
+                lines.append(" " * rng.randint(0, 40))
+            else:
+                indent = " " * rng.randint(0, 12)
+                gap = " " * rng.randint(1, 6)
+                lines.append(indent + gap.join(rng.choice(words) for _ in range(rng.randint(4, 14))))
+        lines.append(" " * 60 + str(page_no))
+        page = "\n".join(lines)
+        pages.append(page)
+        size += len(page)
+    return pages
+
+
+def bench_clean(args):
+    from pdf_reader import TextCleaner, clean_text
+
+    pages = synthetic_pages(args.mb)
+    document = "".join(p + "\n" for p in pages)
+    mb = len(document.encode("utf-8")) / 1_000_000
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - start)
+        return out, best
+
+    def streaming():
+        cleaner = TextCleaner()
+        parts = [cleaner.feed(p + "\n") for p in pages]
+        parts.append(cleaner.finish())
+        return "".join(parts)
+
+    reference, t_ref = timed(lambda: _reference_clean_text(document))
+    whole, t_whole = timed(lambda: clean_text(document))
+    streamed, t_stream = timed(streaming)
+
+    if whole != reference or streamed != reference:
+        print("❌ clean_text output differs from the reference implementation")
+        return 1
+
+    results = {
+        "mb": round(mb, 2),
+        "reference_mbps": round(mb / t_ref, 1),
+        "clean_text_mbps": round(mb / t_whole, 1),
+        "streaming_mbps": round(mb / t_stream, 1),
+    }
+    for name, value in results.items():
+        print(f"{name:<18}{value:>10}")
+    _write_json(args.out, results)
+
+    if args.min_mbps and min(results["clean_text_mbps"], results["streaming_mbps"]) < args.min_mbps:
+        print(f"❌ Below the {args.min_mbps} MB/s floor")
+        return 1
+    return 0
+
+
+# ----------------------------------------------------
+# CHUNKING
+# ----------------------------------------------------
+def bench_chunk(args):
+    from chunker import PAGE_SEPARATOR, iter_chunks
+    from embedder import chunk_text
+    from pdf_reader import clean_text
+
+    pages = [clean_text(p) for p in synthetic_pages(args.mb)]
+    document = PAGE_SEPARATOR.join(p for p in pages if p.strip())
+    mb = len(document.encode("utf-8")) / 1_000_000
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - start)
+        return out, best
+
+    # The splitter needs the whole document as one string; iter_chunks gets pages
+    splitter_chunks, t_split = timed(lambda: chunk_text(document))
+    streamed, t_stream = timed(lambda: list(iter_chunks(enumerate(pages, start=1))))
+
+    if any(document[c.start:c.end] != c.text for c in streamed):
+        print("❌ Chunk offsets do not match the document text")
+        return 1
+
+    results = {
+        "mb": round(mb, 2),
+        "splitter_mbps": round(mb / t_split, 1),
+        "splitter_chunks": len(splitter_chunks),
+        "streaming_mbps": round(mb / t_stream, 1),
+        "streaming_chunks": len(streamed),
+        "speedup": round(t_split / t_stream, 2),
+    }
+    for name, value in results.items():
+        print(f"{name:<18}{value:>10}")
+    _write_json(args.out, results)
+    return 0
+
+
+# ----------------------------------------------------
+# ANN BACKENDS
+# ----------------------------------------------------
+def synthetic_vectors(n: int, dim: int, clusters: int = 200, seed: int = 0):
+    """
+    Unit vectors drawn around random topic centres, roughly how chunk
+    embeddings of many case studies spread out.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def bench_ann(args):
+    import numpy as np
+    from ann_index import build_index
+
+    data = synthetic_vectors(args.n + args.queries, args.dim)
+    base, queries = data[: args.n], data[args.n:]
+
+    exact, _ = build_index(base, "flat")
+    _, truth = exact.search(queries, args.k)
+
+    results = {}
+    print(f"{'spec':<28}{'build s':>9}{'ms/query':>10}{'recall@' + str(args.k):>11}")
+    for spec_text in args.specs:
+        start = time.perf_counter()
+        index, spec = build_index(base, spec_text)
+        build_s = time.perf_counter() - start
+
+        # One query at a time, as retrieve_docs issues them
+        start = time.perf_counter()
+        found = np.vstack([index.search(q.reshape(1, -1), args.k)[1] for q in queries])
+        ms_per_query = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        results[spec_text] = {
+            "spec": spec.as_dict(),
+            "build_s": round(build_s, 2),
+            "ms_per_query": round(ms_per_query, 3),
+            "recall": round(float(recall), 4),
+        }
+        print(f"{spec_text:<28}{build_s:>9.2f}{ms_per_query:>10.3f}{recall:>11.3f}")
+
+    _write_json(args.out, results)
+    return 0
+
+
+# ----------------------------------------------------
+# RAG PIPELINE (stubbed LLM)
+# ----------------------------------------------------
+def estimate_tokens(text: str) -> int:
+    # Gemini averages roughly 4 characters per token on English prose
+    return max(1, len(text) // 4)
+
+
+class StubLLM:
+    """
+    Stands in for gemini_generate: sleeps like a hosted model would
+    (fixed overhead + time per input token) and counts calls/tokens.
+    """
+
+    def __init__(self, base_ms=400.0, ms_per_1k_tokens=60.0):
+        self.base_ms = base_ms
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+        self.calls = 0
+        self.input_tokens = 0
+
+    def __call__(self, prompt, max_tokens=600, temperature=0.0):
+        tokens = estimate_tokens(prompt)
+        self.calls += 1
+        self.input_tokens += tokens
+        time.sleep((self.base_ms + self.ms_per_1k_tokens * tokens / 1000) / 1000)
+        return "Stub answer."
+
+
+def bench_pipeline(args):
+    from langchain_core.documents import Document
+    import rag_pipeline
+
+    rng = random.Random(0)
+    words = "exclusivity revenue brand margin strategy dealer supply growth luxury customers".split()
+    corpus = [" ".join(rng.choice(words) for _ in range(200)) for _ in range(60)]
+
+    # No index or embedding model needed: retrieval returns 15 chunks of the synthetic case
+    originals = (rag_pipeline.gemini_generate, rag_pipeline.retrieve_docs, rag_pipeline.get_index)
+    rag_pipeline.retrieve_docs = lambda index_path, query, k=15, doc_ids=None: [
+        Document(page_content=corpus[(hash(query) + i) % len(corpus)]) for i in range(k)
+    ]
+
+    class _Case:
+        def document_texts(self, doc_ids=None, limit=None):
+            return corpus[:limit]
+
+    case = _Case()
+    rag_pipeline.get_index = lambda index_path: case
+
+    results = {}
+    try:
+        print(f"{'mode':<14}{'calls/q':>9}{'in tokens/q':>13}{'s/q':>8}")
+        for mode in args.modes:
+            llm = StubLLM(args.base_ms, args.ms_per_1k_tokens)
+            rag_pipeline.gemini_generate = llm
+            rag_pipeline._case_summaries.clear()
+
+            start = time.perf_counter()
+            for q in range(args.questions):
+                rag_pipeline.answer_query("stub", f"question {q}", mode=mode)
+            seconds = (time.perf_counter() - start) / args.questions
+
+            results[mode] = {
+                "calls_per_query": round(llm.calls / args.questions, 2),
+                "input_tokens_per_query": round(llm.input_tokens / args.questions),
+                "seconds_per_query": round(seconds, 3),
+            }
+            r = results[mode]
+            print(f"{mode:<14}{r['calls_per_query']:>9}{r['input_tokens_per_query']:>13}{r['seconds_per_query']:>8}")
+    finally:
+        rag_pipeline.gemini_generate, rag_pipeline.retrieve_docs, rag_pipeline.get_index = originals
+
+    _write_json(args.out, results)
+    return 0
+
+
+# ----------------------------------------------------
+# EMBEDDING BACKENDS
+# ----------------------------------------------------
+def _rss_mb(field: str = "VmRSS") -> float:
+    """
+    Current resident set size of this process in MB (peak if /proc is missing).
+    field="RssAnon" counts only private memory, not mapped file pages.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _embed_backend_run(backend, texts, queries):
+    # Runs in a fresh process per backend so RSS is not shared between them
+    from sentence_transformers import SentenceTransformer
+    from embedder import MODEL_NAME
+    from embedding_engine import EmbeddingEngine, backend_model_kwargs
+
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    model = SentenceTransformer(MODEL_NAME, device="cpu", **backend_model_kwargs(backend))
+    load_s = time.perf_counter() - start
+    engine = EmbeddingEngine(model)
+    engine.embed(queries[:5])
+
+    # One query at a time, as retrieve_docs embeds them
+    latencies = []
+    query_vectors = []
+    for q in queries:
+        start = time.perf_counter()
+        query_vectors.append(engine.embed([q])[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    doc_vectors = engine.embed(texts)
+    stats = engine.last_stats
+    return {
+        "load_s": round(load_s, 2),
+        "query_ms_p50": round(statistics.median(latencies), 2),
+        "query_ms_p95": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 2),
+        "chunks_per_sec": round(stats.chunks_per_sec, 1),
+        "rss_mb": round(_rss_mb() - rss_start, 1),
+    }, doc_vectors, query_vectors
+
+
+def bench_embed(args):
+    import multiprocessing
+
+    import numpy as np
+    from chunker import iter_chunks
+    from pdf_reader import clean_text
+
+    pages = [clean_text(p) for p in synthetic_pages(2)]
+    texts = [c.text for c in iter_chunks(enumerate(pages, start=1))][: args.chunks]
+    rng = random.Random(1)
+    words = " ".join(texts).split()
+    queries = [" ".join(rng.choice(words) for _ in range(rng.randint(4, 12))) for _ in range(args.queries)]
+
+    results, reference = {}, None
+    print(f"{'backend':<12}{'load s':>8}{'q p50 ms':>10}{'q p95 ms':>10}{'chunks/s':>10}{'RSS MB':>8}"
+          f"{'cosine':>8}{'top-' + str(args.k) + ' agree':>14}")
+    ctx = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        with ctx.Pool(1) as pool:
+            result, docs, qs = pool.apply(_embed_backend_run, (backend, texts, queries))
+        docs, qs = np.asarray(docs), np.asarray(qs)
+        top = np.argsort(-(qs @ docs.T), axis=1)[:, : args.k]
+
+        # Agreement with the first backend: same vectors, same retrieved chunks?
+        if reference is None:
+            reference = (docs, top)
+        ref_docs, ref_top = reference
+        result["cosine"] = round(float(np.mean(np.sum(docs * ref_docs, axis=1))), 4)
+        result["agreement"] = round(float(np.mean(
+            [len(set(a) & set(b)) / args.k for a, b in zip(top, ref_top)]
+        )), 3)
+        results[backend] = result
+        print(f"{backend:<12}{result['load_s']:>8}{result['query_ms_p50']:>10}{result['query_ms_p95']:>10}"
+              f"{result['chunks_per_sec']:>10}{result['rss_mb']:>8}{result['cosine']:>8}{result['agreement']:>14}")
+
+    _write_json(args.out, results)
+    return 0
+
+
+# ----------------------------------------------------
+# RESIDENT MEMORY PER LOADED CASE
+# ----------------------------------------------------
+def _warm_up():
+    # One-off costs of the process, not of a case: faiss itself and the
+    # first Document built (langchain/pydantic set up lazily)
+    import faiss  # noqa: F401
+    from langchain_core.documents import Document
+
+    Document(page_content="")
+
+
+def _load_legacy(path, queries, k):
+    # The old layout: a pickled LangChain FAISS store, i.e. a float32 index,
+    # one Document per chunk in a docstore dict and a row -> UUID dict
+    import pickle
+
+    import faiss
+
+    _warm_up()
+    start = _rss_mb(), _rss_mb("RssAnon")
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    index = faiss.deserialize_index(data["index"])
+    docstore, index_to_docstore_id = data["docstore"], data["index_to_docstore_id"]
+    del data
+
+    _, rows = index.search(queries, k)
+    docs = [[docstore[index_to_docstore_id[int(r)]] for r in found] for found in rows]
+    assert docs
+    return round(_rss_mb() - start[0], 1), round(_rss_mb("RssAnon") - start[1], 1)
+
+
+def _load_index_dir(path, queries, k):
+    from index_store import CaseIndex
+
+    _warm_up()
+    start = _rss_mb(), _rss_mb("RssAnon")
+    db = CaseIndex.load(path, None)
+    hits = db.search_rows_batch(queries, k)
+    docs = [[db.document(row) for _, row in found] for found in hits]
+    assert docs
+    return round(_rss_mb() - start[0], 1), round(_rss_mb("RssAnon") - start[1], 1)
+
+
+def bench_memory(args):
+    import multiprocessing
+    import pickle
+    import shutil
+    import tempfile
+    import uuid
+
+    import faiss
+    from langchain_core.documents import Document
+    from ann_index import build_index
+    from chunker import iter_chunks
+    from index_store import CaseIndex, ChunkStore
+    from pdf_reader import clean_text
+
+    pages = [clean_text(p) for p in synthetic_pages(args.chunks * 1200 / 1e6 * 1.3)]
+    chunks = list(iter_chunks(enumerate(pages, start=1)))[: args.chunks]
+    vectors = synthetic_vectors(len(chunks) + args.queries, args.dim)
+    vectors, queries = vectors[: len(chunks)], vectors[len(chunks):]
+
+    tmp = tempfile.mkdtemp(prefix="bench_memory_")
+    try:
+        legacy_path = os.path.join(tmp, "legacy.pkl")
+        flat, _ = build_index(vectors, "flat")
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        with open(legacy_path, "wb") as f:
+            pickle.dump({
+                "index": faiss.serialize_index(flat),
+                "docstore": {i: Document(page_content=c.text, metadata={}) for i, c in zip(ids, chunks)},
+                "index_to_docstore_id": dict(enumerate(ids)),
+            }, f)
+
+        layouts = {"legacy pickle": (_load_legacy, legacy_path)}
+        for codec in args.codecs:
+            path = os.path.join(tmp, codec)
+            index, spec = build_index(vectors, f"flat:codec={codec}")
+            CaseIndex(index, ChunkStore.from_chunks(chunks), None, {"index_spec": spec.as_dict()}).save(path)
+            layouts[f"store {codec}"] = (_load_index_dir, path)
+
+        # RSS includes mapped index/chunk file pages: clean page cache that
+        # is shared between processes and reclaimable. "private" is the heap
+        # memory a loaded case really pins.
+        results, baseline = {}, None
+        print(f"{len(chunks)} chunks, {args.dim}-dim vectors")
+        print(f"{'layout':<16}{'RSS MB':>8}{'private MB':>12}{'vs legacy':>11}")
+        ctx = multiprocessing.get_context("spawn")
+        for name, (loader, path) in layouts.items():
+            # A fresh process per layout, so nothing is shared or already cached
+            with ctx.Pool(1) as pool:
+                rss, private = pool.apply(loader, (path, queries, args.k))
+            baseline = baseline or private
+            ratio = round(baseline / private, 1) if private > 0 else None
+            results[name] = {"rss_mb": rss, "private_mb": private, "ratio": ratio}
+            print(f"{name:<16}{rss:>8}{private:>12}{(str(ratio) + 'x') if ratio else '-':>11}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    _write_json(args.out, results)
+    return 0
+
+
+# ----------------------------------------------------
+# CLI
+# ----------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the case study RAG pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("importtime", help="Cold import cost of each module.")
+    p.add_argument("--modules", nargs="+", default=IMPORT_MODULES)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--out", help="Write results as JSON, to track them over time.")
+    p.add_argument("--max-ms", type=float, help="Exit non-zero if any module's median exceeds this.")
+    p.set_defaults(func=bench_importtime)
+
+    p = sub.add_parser("clean", help="clean_text throughput on a synthetic document.")
+    p.add_argument("--mb", type=float, default=20, help="Size of the synthetic document.")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--out", help="Write results as JSON.")
+    p.add_argument("--min-mbps", type=float, help="Exit non-zero below this throughput.")
+    p.set_defaults(func=bench_clean)
+
+    p = sub.add_parser("chunk", help="Streaming chunker vs RecursiveCharacterTextSplitter.")
+    p.add_argument("--mb", type=float, default=20, help="Size of the synthetic document.")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--out", help="Write results as JSON.")
+    p.set_defaults(func=bench_chunk)
+
+    p = sub.add_parser("ann", help="Recall vs latency of each index type against exact search.")
+    p.add_argument("--n", type=int, default=100_000, help="Vectors in the synthetic corpus.")
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=15)
+    p.add_argument("--specs", nargs="+", default=["flat", "ivf", "hnsw", "ivfpq", "auto"])
+    p.add_argument("--out", help="Write results as JSON.")
+    p.set_defaults(func=bench_ann)
+
+    p = sub.add_parser("pipeline", help="LLM calls, input tokens and latency per answer_query mode.")
+    p.add_argument("--questions", type=int, default=20)
+    p.add_argument("--modes", nargs="+", default=["two_pass", "single", "case_summary"])
+    p.add_argument("--base-ms", type=float, default=400.0, help="Stub LLM fixed latency per call.")
+    p.add_argument("--ms-per-1k-tokens", type=float, default=60.0, help="Stub LLM latency per 1k input tokens.")
+    p.add_argument("--out", help="Write results as JSON.")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("embed", help="Latency, throughput, RSS and retrieval agreement per embedding backend.")
+    p.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                   help="The first one is the reference for agreement.")
+    p.add_argument("--chunks", type=int, default=512)
+    p.add_argument("--queries", type=int, default=100)
+    p.add_argument("--k", type=int, default=15)
+    p.add_argument("--out", help="Write results as JSON.")
+    p.set_defaults(func=bench_embed)
+
+    p = sub.add_parser("memory", help="Resident memory of one loaded case per storage layout and codec.")
+    p.add_argument("--chunks", type=int, default=2000)
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--codecs", nargs="+", default=["f32", "fp16", "sq8"])
+    p.add_argument("--queries", type=int, default=50)
+    p.add_argument("--k", type=int, default=15)
+    p.add_argument("--out", help="Write results as JSON.")
+    p.set_defaults(func=bench_memory)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# chunker.py — streaming, structure-aware chunking of page texts
+#
+# iter_chunks() takes (page_number, text) pairs, e.g. from
+# pdf_reader.iter_pdf_pages(), and yields Chunk records as soon as they are
+# complete. Only the text that can still end up in a chunk (the current
+# chunk plus its overlap) is buffered, never the whole document.
+#
+# Like RecursiveCharacterTextSplitter it breaks at the coarsest boundary
+# that fits: a paragraph, else a line, else a sentence, else a word. It
+# finds that boundary with one str.rfind per separator per chunk instead of
+# splitting the text into pieces and merging them back, which is what makes
+# it faster on large documents. Pages are joined with a blank line, and
+# start/end are character offsets in that joined document, so a chunk can
+# always be traced back to the source.
+
+import hashlib
+from bisect import bisect_right
+from dataclasses import dataclass
+
+
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 250
+PAGE_SEPARATOR = "\n\n"
+
+# Coarsest first
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+# Slotted: a big document yields many of these before they reach the index
+@dataclass(slots=True)
+class Chunk:
+    text: str
+    page: int          # page the chunk starts on (1-based)
+    end_page: int      # page it ends on
+    start: int         # character offsets in the page-joined document
+    end: int
+    seq: int           # position in the document
+
+    @property
+    def chunk_id(self) -> str:
+        """
+        Content id: identical chunk texts share it (used to dedupe).
+        """
+        return chunk_id(self.text)
+
+
+def chunk_id(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _cut(text, lo, limit):
+    """
+    End of a chunk starting at text[lo]: the last separator within `limit`
+    characters, coarsest kind first. A separator in the first half of the
+    window only counts if there is no boundary at all in the second half,
+    so chunks stay reasonably full.
+    """
+    hi = len(text)
+    if lo + limit >= hi:
+        # Only at the end of the document: the rest fits
+        return hi
+    for min_fill in (limit // 2, 1):
+        for sep in SEPARATORS:
+            i = text.rfind(sep, lo + min_fill, min(lo + limit + len(sep), hi))
+            if i >= lo + min_fill:
+                # A sentence keeps its full stop
+                return i + 1 if sep == ". " else i
+    return min(lo + limit, hi)
+
+
+def _overlap_start(text, lo, end, overlap):
+    """
+    Where the next chunk starts: the first word boundary at most `overlap`
+    characters (and at most half the chunk) before end, or end itself.
+    """
+    target = max(end - overlap, lo + (end - lo + 1) // 2)
+    space, newline = text.find(" ", target, end), text.find("\n", target, end)
+    if space < 0 or 0 <= newline < space:
+        space = newline
+    return end if space < 0 else space
+
+
+def iter_chunks(pages, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Yield Chunk records from (page_number, text) pairs.
+    Consecutive chunks share up to chunk_overlap characters of whole words.
+    """
+    buffer = ""            # document text from offset `base` onwards
+    base = 0
+    pos = 0                # start of the next chunk, as an index into buffer
+    page_starts = []       # start offsets and numbers of the buffered pages
+    page_numbers = []
+    seq = 0
+    # A full window, plus room for a separator right at its end
+    window = chunk_size + max(map(len, SEPARATORS))
+
+    def drain(buffer, final):
+        # Chunks whose window is complete (all remaining ones when final)
+        nonlocal pos, seq
+        n = len(buffer)
+        while True:
+            while pos < n and buffer[pos].isspace():
+                pos += 1
+            if pos >= n or (n - pos <= window and not final):
+                return
+
+            end = _cut(buffer, pos, chunk_size)
+            text = buffer[pos:end].rstrip()
+            start = base + pos
+            stop = start + len(text)
+            yield Chunk(
+                text,
+                page_numbers[bisect_right(page_starts, start) - 1],
+                page_numbers[bisect_right(page_starts, stop - 1) - 1],
+                start, stop, seq,
+            )
+            seq += 1
+            if end >= n:
+                pos = n
+                return
+            pos = _overlap_start(buffer, pos, pos + len(text), chunk_overlap)
+
+    for page_no, text in pages:
+        if not text.strip():
+            continue
+
+        # Drop text no chunk can reach any more, in large steps
+        if pos > 16 * window:
+            buffer, base, pos = buffer[pos:], base + pos, 0
+            while len(page_starts) > 1 and page_starts[1] <= base:
+                del page_starts[0], page_numbers[0]
+
+        if buffer:
+            buffer += PAGE_SEPARATOR
+        page_starts.append(base + len(buffer))
+        page_numbers.append(page_no)
+        buffer += text
+
+        yield from drain(buffer, final=False)
+
+    yield from drain(buffer, final=True)
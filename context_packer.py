@@ -0,0 +1,150 @@
+# context_packer.py — fit retrieved chunks into a prompt token budget
+#
+# Retrieval returns 15 chunks of up to 1200 characters, and consecutive
+# chunks of a case share a 250-character overlap. pack_context() turns them
+# into the RAW CONTEXT block of the prompt:
+#   1. scores each chunk by its retrieval rank and how many of the
+#      question's terms it contains
+#   2. merges chunks that overlap or touch in the same document (using the
+#      start/end offsets recorded by chunker.py), so shared text is sent once
+#   3. adds the merged passages best first until CONTEXT_TOKEN_BUDGET is
+#      used up; a passage that does not fit is cut at a sentence boundary
+# Tokens are estimated at 4 characters each, close enough for Gemini.
+
+import logging
+import os
+import threading
+
+from sparse_index import tokenize
+
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens the retrieved context may use (0 = no limit)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Weight of question-term coverage against retrieval rank in a chunk's score
+TERM_WEIGHT = 0.3
+# A passage is cut to fit only if at least this many tokens are left
+MIN_PARTIAL_TOKENS = 80
+CHARS_PER_TOKEN = 4
+
+# Running totals for the UI
+_pack_stats = {"queries": 0, "tokens_in": 0, "tokens_out": 0, "merged": 0, "dropped": 0}
+_pack_stats_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_passages(texts) -> str:
+    return "\n\n".join(f"[DOC {i+1}]\n{text}" for i, text in enumerate(texts))
+
+
+def _score(docs, query):
+    # Rank 0 scores 1, the last rank close to 0
+    n = len(docs)
+    terms = set(tokenize(query)) if query else set()
+    scores = []
+    for rank, doc in enumerate(docs):
+        score = 1.0 - rank / n
+        if terms:
+            coverage = len(terms & set(tokenize(doc.page_content))) / len(terms)
+            score = (1.0 - TERM_WEIGHT) * score + TERM_WEIGHT * coverage
+        scores.append(score)
+    return scores
+
+
+def _merge(docs, scores):
+    """
+    Passages as [score, start, end, text], one per group of chunks that
+    overlap or touch in the same document. Chunks without offsets
+    (older indexes) stay passages of their own.
+    """
+    passages, by_doc = [], {}
+    for doc, score in zip(docs, scores):
+        meta = doc.metadata
+        if "start" in meta and "end" in meta:
+            by_doc.setdefault(meta.get("doc_id"), []).append((meta["start"], meta["end"], doc.page_content, score))
+        else:
+            passages.append([score, None, None, doc.page_content])
+
+    for chunks in by_doc.values():
+        chunks.sort(key=lambda c: (c[0], c[1]))
+        current = None
+        for start, end, text, score in chunks:
+            # Chunk starts skip whitespace, so "touching" allows a short gap
+            if current is not None and start <= current[2] + 2:
+                if end > current[2]:
+                    gap = start - current[2]
+                    current[3] += ("\n" if gap > 0 else "") + text[max(0, current[2] - start):]
+                    current[2] = end
+                current[0] = max(current[0], score)
+            else:
+                current = [score, start, end, text]
+                passages.append(current)
+    return passages
+
+
+def _truncate(text, max_chars):
+    # Last sentence (or line) end that fits, else the last word
+    cut = max(text.rfind(". ", 0, max_chars), text.rfind("\n", 0, max_chars))
+    if cut < max_chars // 2:
+        cut = text.rfind(" ", 0, max_chars)
+    return text[: cut + 1 if cut > 0 else max_chars].rstrip()
+
+
+def pack_context(docs, query: str = None, budget: int = None):
+    """
+    RAW CONTEXT text for the prompt and a stats dict
+    (tokens_in, tokens_out, chunks, passages, merged, dropped).
+    Without a query chunks keep their given order.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    docs = list(docs)
+    tokens_in = estimate_tokens(format_passages(d.page_content for d in docs))
+
+    passages = _merge(docs, _score(docs, query)) if docs else []
+    order = sorted(range(len(passages)), key=lambda i: -passages[i][0])
+
+    chosen, used, dropped = [], 0, 0
+    for i in order:
+        text = passages[i][3]
+        # Header and separator of the passage
+        cost = estimate_tokens(text) + 4
+        if budget and used + cost > budget:
+            left = budget - used - 4
+            if left < MIN_PARTIAL_TOKENS:
+                dropped += 1
+                continue
+            text = _truncate(text, left * CHARS_PER_TOKEN)
+            cost = estimate_tokens(text) + 4
+        chosen.append(text)
+        used += cost
+
+    packed = format_passages(chosen)
+    stats = {
+        "tokens_in": tokens_in,
+        "tokens_out": estimate_tokens(packed),
+        "chunks": len(docs),
+        "passages": len(passages),
+        "merged": len(docs) - len(passages),
+        "dropped": dropped,
+    }
+    with _pack_stats_lock:
+        _pack_stats["queries"] += 1
+        for name in ("tokens_in", "tokens_out", "merged", "dropped"):
+            _pack_stats[name] += stats[name]
+    logger.info(
+        "context packed: %d -> %d tokens (%d saved), %d chunks -> %d passages, %d dropped",
+        stats["tokens_in"], stats["tokens_out"], stats["tokens_in"] - stats["tokens_out"],
+        stats["chunks"], len(chosen), dropped,
+    )
+    return packed, stats
+
+
+def packing_stats():
+    with _pack_stats_lock:
+        stats = dict(_pack_stats)
+    stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+    return stats
@@ -0,0 +1,117 @@
+# diversity.py — near-duplicate chunk removal and MMR result diversification
+#
+# Case PDFs repeat headers, footers and exhibit boilerplate on every page,
+# so many chunks are almost the same text. dedupe_texts() drops them before
+# they are embedded (SimHash over word 3-grams; two chunks are near
+# duplicates when their 64-bit fingerprints differ in at most
+# NEAR_DUP_DISTANCE bits). mmr_select() then keeps the k retrieved chunks
+# from filling up with variations of one passage.
+
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+
+
+# Max differing SimHash bits for two chunks to count as duplicates (-1 = off)
+NEAR_DUP_DISTANCE = int(os.getenv("NEAR_DUP_DISTANCE", "3"))
+# MMR trade-off: 1.0 = pure relevance (off), lower = more diverse results
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# MMR chooses k results out of this many times k fused candidates
+MMR_FETCH_FACTOR = 2
+
+SHINGLE_SIZE = 3
+_WORD = re.compile(r"\w+")
+_BITS = np.arange(64, dtype=np.uint64)
+
+# Running totals for the UI: MMR searches and results it swapped out
+_mmr_stats = {"searches": 0, "replaced": 0}
+_mmr_stats_lock = threading.Lock()
+
+
+# ----------------------------------------------------
+# NEAR-DUPLICATE REMOVAL
+# ----------------------------------------------------
+def simhash(text) -> int:
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i : i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    # Each bit is set if more shingles have it set than not
+    counts = ((hashes[:, None] >> _BITS) & np.uint64(1)).sum(axis=0)
+    bits = counts * 2 > len(hashes)
+    return int(np.packbits(bits, bitorder="little").view("<u8")[0])
+
+
+def dedupe_texts(texts, max_distance=None):
+    """
+    Indexes of texts to keep: the first of every group of near duplicates.
+    Fingerprints are split into max_distance + 1 bands; two fingerprints
+    within max_distance bits must agree on at least one whole band, so only
+    chunks sharing a band are compared.
+    """
+    max_distance = NEAR_DUP_DISTANCE if max_distance is None else max_distance
+    if max_distance < 0:
+        return list(range(len(texts)))
+
+    n_bands = max_distance + 1
+    band_bits = 64 // n_bands
+    mask = (1 << band_bits) - 1
+    buckets = [{} for _ in range(n_bands)]
+
+    keep, kept_hashes = [], []
+    for i, text in enumerate(texts):
+        h = simhash(text)
+        bands = [(h >> (b * band_bits)) & mask for b in range(n_bands)]
+        candidates = {j for b, band in enumerate(bands) for j in buckets[b].get(band, ())}
+        if any(bin(h ^ kept_hashes[j]).count("1") <= max_distance for j in candidates):
+            continue
+        for b, band in enumerate(bands):
+            buckets[b].setdefault(band, []).append(len(keep))
+        keep.append(i)
+        kept_hashes.append(h)
+    return keep
+
+
+# ----------------------------------------------------
+# MMR
+# ----------------------------------------------------
+def mmr_select(relevance, vectors, k, lambda_mult=None):
+    """
+    Maximal marginal relevance over candidates ordered best first.
+    relevance: scores in [0, 1]; vectors: one row per candidate.
+    Returns the positions of the k chosen candidates.
+    """
+    lambda_mult = MMR_LAMBDA if lambda_mult is None else lambda_mult
+    n = len(relevance)
+    if n <= k or lambda_mult >= 1.0:
+        return list(range(min(n, k)))
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = vectors @ vectors.T
+
+    chosen = [0]
+    max_sim = similarity[0].copy()
+    while len(chosen) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        max_sim = np.maximum(max_sim, similarity[best])
+
+    with _mmr_stats_lock:
+        _mmr_stats["searches"] += 1
+        _mmr_stats["replaced"] += sum(1 for i in chosen if i >= k)
+    return chosen
+
+
+def mmr_stats():
+    with _mmr_stats_lock:
+        return dict(_mmr_stats)
@@ -1,20 +1,56 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-import pickle
+from collections import OrderedDict
+import os
+import shutil
+import threading
 
-
-# Load embedding model correctly for FAISS
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+from ann_index import build_index
+from chunker import Chunk
+from diversity import dedupe_texts
+from embedding_cache import EmbeddingCache, chunk_key
+from embedding_engine import (
+    EMBED_BACKEND, EmbeddingEngine, EmbeddingStats, backend_model_kwargs, check_backend, vector_space,
+)
+from query_cache import drop_semantic_cache
+from sparse_index import BM25Index
+from index_store import (
+    CaseIndex, ChunkStore, Collection, META_FILE, MANIFEST_FILE,
+    is_collection_dir, is_index_dir, migrate_pickle,
 )
 
 
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# The model is heavy (torch + weights), so it is built on first use,
+# not at import time. See get_embedding_model().
+_embedding_model = None
+_embedding_engine = None
+_model_lock = threading.Lock()
+
+# Indexes are directories named "<case>_index" (see index_store.py)
+INDEX_SUFFIX = "_index"
+LEGACY_INDEX_SUFFIX = "_index.pkl"
+# All uploaded cases live in one collection directory under outputs/
+COLLECTION_DIR_NAME = "case_collection"
+
+# How many loaded indexes to keep in memory (least recently used is dropped)
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "8"))
+
+# Opened on first use by get_embedding_cache()
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+# path -> ((mtime_ns, size), db)
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
 def chunk_text(text, chunk_size=1200, chunk_overlap=250):
     """
     Larger chunks keep paragraphs intact → answers more accurate.
     """
+    # Slow to import and only needed here, so it is not imported with the module
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap
@@ -22,20 +58,241 @@ def chunk_text(text, chunk_size=1200, chunk_overlap=250):
     return splitter.split_text(text)
 
 
-def embed_and_build_index(chunks):
+def get_embedding_model():
     """
-    Build FAISS index using chunks.
+    Shared HuggingFaceEmbeddings instance, created once per process
+    on the backend chosen by EMBED_BACKEND.
     """
-    docs = [Document(page_content=c) for c in chunks]
-    db = FAISS.from_documents(docs, embedding_model)
-    return db
+    global _embedding_model
+    if _embedding_model is None:
+        with _model_lock:
+            if _embedding_model is None:
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                _embedding_model = HuggingFaceEmbeddings(
+                    model_name=MODEL_NAME, model_kwargs=backend_model_kwargs(EMBED_BACKEND)
+                )
+    return _embedding_model
+
+
+def get_embedding_engine():
+    """
+    Batched indexing path; shares the SentenceTransformer held by the model.
+    """
+    global _embedding_engine
+    if _embedding_engine is None:
+        model = get_embedding_model()
+        with _model_lock:
+            if _embedding_engine is None:
+                _embedding_engine = EmbeddingEngine(model.client)
+    return _embedding_engine
+
+
+def __getattr__(name):
+    # Old code imports `embedding_model` / `embedding_engine` directly
+    if name == "embedding_model":
+        return get_embedding_model()
+    if name == "embedding_engine":
+        return get_embedding_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_embedding_cache():
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(dim=get_embedding_engine().dim)
+        return _embedding_cache
+
+
+def cache_model_name():
+    # Quantized vectors must not be served to (or from) the fp32 cache entries
+    space = vector_space(EMBED_BACKEND)
+    return MODEL_NAME if space == "fp32" else f"{MODEL_NAME}@{space}"
+
+
+def embed_and_build_index(
+    chunks, engine=None, use_cache=True, index_spec=None, progress=None, near_dup_distance=None
+):
+    """
+    Build FAISS index using chunks: plain strings, or chunker.Chunk records
+    whose page/offset metadata is stored with the index.
+    Near-duplicate chunks (repeated headers, footers, boilerplate) are
+    dropped first, see diversity.py; near_dup_distance=-1 keeps them all.
+    The number removed is reported as embed_stats["duplicates"].
+    Only chunks missing from the embedding cache are sent to the model.
+    index_spec picks flat / ivf / hnsw / ivfpq (see ann_index.py); the
+    default "auto" keeps exact search for a single case.
+    Embedding throughput is kept in the index metadata under "embed_stats".
+    A BM25 keyword index over the same chunks is built and saved with it.
+    progress(done, total) reports embedded chunks (cache hits count as done).
+    """
+    engine = engine or get_embedding_engine()
+    records = list(chunks)
+    texts = [c.text if isinstance(c, Chunk) else c for c in records]
+    keep = dedupe_texts(texts, near_dup_distance)
+    duplicates = len(records) - len(keep)
+    records = [records[i] for i in keep]
+    chunks = [texts[i] for i in keep]
+    if records and isinstance(records[0], Chunk):
+        store = ChunkStore.from_chunks(records)
+    else:
+        store = ChunkStore.from_texts(chunks)
+
+    if use_cache:
+        cache = get_embedding_cache()
+        keys = [chunk_key(cache_model_name(), c) for c in chunks]
+        vectors, missing = cache.lookup(keys)
+        if missing:
+            hits = len(chunks) - len(missing)
+            batch_progress = progress and (lambda done, _: progress(hits + done, len(chunks)))
+            fresh = engine.embed([chunks[i] for i in missing], batch_progress)
+            vectors[missing] = fresh
+            cache.add([keys[i] for i in missing], fresh)
+        else:
+            engine.last_stats = EmbeddingStats()
+    else:
+        vectors, missing = engine.embed(chunks, progress), range(len(chunks))
+
+    index, spec = build_index(vectors.reshape(len(chunks), engine.dim), index_spec)
+
+    stats = engine.last_stats.as_dict()
+    stats["cached"] = len(chunks) - len(missing)
+    stats["duplicates"] = duplicates
+    meta = {
+        "model": MODEL_NAME, "embedding_backend": EMBED_BACKEND,
+        "embed_stats": stats, "index_spec": spec.as_dict(),
+    }
+    return CaseIndex(index, store, get_embedding_model(), meta, BM25Index.from_texts(chunks))
 
 
 def save_index(db, path):
-    with open(path, "wb") as f:
-        pickle.dump(db, f)
+    db.save(path)
+    evict_index(path)
 
 
 def load_index(path):
-    with open(path, "rb") as f:
-        return pickle.load(f)
+    """
+    Open an index or collection directory. Old pickled "<case>_index.pkl"
+    files are migrated to the directory layout on first load.
+    Indexes built with an incompatible EMBED_BACKEND are refused.
+    """
+    path = _resolve_index_path(path)
+    if is_collection_dir(path):
+        db = Collection(path, get_embedding_model())
+        # An empty collection takes the backend of its first document
+        if db.embedding_backend is not None:
+            check_backend(db.embedding_backend, path)
+        return db
+    db = CaseIndex.load(path, get_embedding_model())
+    check_backend(db.meta.get("embedding_backend"), path)
+    return db
+
+
+def _resolve_index_path(path):
+    if path.endswith(".pkl"):
+        legacy_path, path = path, path[: -len(".pkl")]
+        if os.path.exists(legacy_path):
+            migrate_pickle(legacy_path, get_embedding_model(), {"model": MODEL_NAME})
+    return path
+
+
+def migrate_legacy_indexes(directory, collection_path=None):
+    """
+    Migrate every "<case>_index.pkl" in a directory to the new layout.
+    With collection_path, per-case "<case>_index" directories are then
+    moved into that collection as document "<case>.pdf".
+    """
+    for name in os.listdir(directory):
+        if name.endswith(LEGACY_INDEX_SUFFIX):
+            _resolve_index_path(os.path.join(directory, name))
+
+    if collection_path is None:
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(INDEX_SUFFIX) and is_index_dir(path):
+            add_to_collection(collection_path, name[: -len(INDEX_SUFFIX)] + ".pdf", load_index(path))
+            evict_index(path)
+            shutil.rmtree(path)
+
+
+def open_collection(path):
+    """
+    The (cached) collection at path, created empty if it does not exist yet.
+    """
+    if not is_collection_dir(path):
+        Collection.open(path, get_embedding_model(), create=True)
+    return get_index(path)
+
+
+def add_to_collection(collection_path, doc_id, db, source_hash=None):
+    """
+    Append a freshly built index to the collection as document doc_id,
+    replacing any earlier version of that document.
+    source_hash (see utils.file_sha256) lets callers skip unchanged files later.
+    """
+    open_collection(collection_path).add_document(doc_id, db, source_hash)
+
+
+def delete_from_collection(collection_path, doc_id):
+    """
+    Remove a document's vectors from the collection without a rebuild.
+    """
+    if is_collection_dir(collection_path):
+        open_collection(collection_path).delete_document(doc_id)
+
+
+def _file_version(path):
+    # meta.json / manifest.json are rewritten last on every change,
+    # so they version the whole directory
+    if os.path.isdir(path):
+        manifest = os.path.join(path, MANIFEST_FILE)
+        path = manifest if os.path.exists(manifest) else os.path.join(path, META_FILE)
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def get_index(path):
+    """
+    Cached load_index: warm queries reuse the in-memory index.
+    An entry is reloaded when the index changes on disk.
+    """
+    key = os.path.abspath(_resolve_index_path(path))
+    version = _file_version(key)
+
+    with _index_cache_lock:
+        entry = _index_cache.get(key)
+        if entry is not None and entry[0] == version:
+            _index_cache.move_to_end(key)
+            return entry[1]
+
+    db = load_index(key)
+
+    with _index_cache_lock:
+        stale = _index_cache.get(key)
+        if stale is not None and stale[1] is not db:
+            # Answers cached for the old version no longer hold
+            drop_semantic_cache(stale[1])
+        _index_cache[key] = (version, db)
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+
+    return db
+
+
+def evict_index(path=None):
+    """
+    Drop one index (or all, if path is None) from the in-memory cache.
+    """
+    with _index_cache_lock:
+        if path is None:
+            evicted = list(_index_cache.values())
+            _index_cache.clear()
+        else:
+            key = os.path.abspath(path)
+            if key.endswith(".pkl"):
+                key = key[: -len(".pkl")]
+            evicted = [_index_cache.pop(key)] if key in _index_cache else []
+    for _, db in evicted:
+        drop_semantic_cache(db)
@@ -0,0 +1,147 @@
+# embedding_cache.py — persistent, content-addressed cache of chunk embeddings
+#
+# Layout of the cache directory:
+#   vectors.f32  float32 rows, appended, read through np.memmap
+#   keys.bin     16-byte blake2b(model + text) digests, one per row
+#   meta.json    dim of the stored vectors
+#
+# Rows are appended before their keys, so a crash mid-write can only leave
+# unreferenced rows behind; the next add() truncates them away. Writers
+# (the app and preprocess_cases.py may share a cache) take a file lock and
+# re-read keys.bin first, so a row is committed once its key is on disk
+# and is never truncated by another process.
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils import file_lock
+
+
+DEFAULT_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join("outputs", "embedding_cache"))
+
+KEY_SIZE = 16
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.bin"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+def chunk_key(model_name: str, text: str) -> bytes:
+    h = hashlib.blake2b(digest_size=KEY_SIZE)
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingCache:
+
+    def __init__(self, path=None, dim=None):
+        self.path = path or DEFAULT_CACHE_DIR
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._rows = {}        # digest -> row number
+        self._committed = 0    # rows of keys.bin read so far
+        self._vectors = None   # np.memmap over vectors.f32
+        self._open()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        if os.path.exists(self._file(META_FILE)):
+            with open(self._file(META_FILE), "r", encoding="utf-8") as f:
+                stored_dim = json.load(f)["dim"]
+            if self.dim is not None and self.dim != stored_dim:
+                raise ValueError(
+                    f"Embedding cache at {self.path} holds {stored_dim}-dim vectors, "
+                    f"expected {self.dim}. Point EMBED_CACHE_DIR elsewhere or delete it."
+                )
+            self.dim = stored_dim
+
+        self._load_keys()
+        self._map_vectors()
+
+    def _load_keys(self):
+        # Read keys committed since the last call (by any process).
+        # Returns the number of committed rows.
+        path = self._file(KEYS_FILE)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                f.seek(self._committed * KEY_SIZE)
+                raw = f.read()
+            for i in range(len(raw) // KEY_SIZE):
+                self._rows[raw[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = self._committed + i
+            self._committed += len(raw) // KEY_SIZE
+        return self._committed
+
+    def _map_vectors(self):
+        self._vectors = None
+        if self.dim and os.path.exists(self._file(VECTORS_FILE)):
+            n_rows = os.path.getsize(self._file(VECTORS_FILE)) // (4 * self.dim)
+            if n_rows:
+                self._vectors = np.memmap(
+                    self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(n_rows, self.dim)
+                )
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, keys):
+        """
+        Returns (vectors, missing): a float32 matrix with the cached rows
+        filled in, and the positions in `keys` that still need embedding.
+        """
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                # Another process may have embedded them since
+                self._load_keys()
+                self._map_vectors()
+            vectors = np.zeros((len(keys), self.dim or 0), dtype=np.float32)
+            missing = []
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is None or self._vectors is None or row >= len(self._vectors):
+                    missing.append(i)
+                else:
+                    vectors[i] = self._vectors[row]
+            return vectors, missing
+
+    def add(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, file_lock(self._file(LOCK_FILE)):
+            # Rows other writers committed since we last looked
+            start = self._load_keys()
+
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows:
+                    new.setdefault(key, vector)
+            if not new:
+                self._map_vectors()
+                return
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if not os.path.exists(self._file(META_FILE)):
+                with open(self._file(META_FILE), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+
+            # Only a crashed writer's uncommitted tail (rows past the last key)
+            # can be dropped here; the lock means nobody else is mid-write
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                f.truncate(start * 4 * self.dim)
+                f.write(np.stack(list(new.values())).tobytes())
+            with open(self._file(KEYS_FILE), "ab") as f:
+                f.truncate(start * KEY_SIZE)
+                f.write(b"".join(new))
+
+            for offset, key in enumerate(new):
+                self._rows[key] = start + offset
+            self._map_vectors()
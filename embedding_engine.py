@@ -0,0 +1,177 @@
+# embedding_engine.py — batched, multi-core chunk embedding for indexing
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+
+# Defaults can be tuned per machine without code changes
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+DEFAULT_THREADS = int(os.getenv("EMBED_THREADS", "0"))   # 0 = leave torch's default
+DEFAULT_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))   # >1 = shard across processes
+
+# Inference backend of the embedding model:
+#   "torch"      full-precision PyTorch (default)
+#   "onnx"       the same fp32 weights on ONNX Runtime
+#   "onnx-int8"  dynamically int8-quantized ONNX export, fastest on CPU
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# Quantized export shipped in the model repo (portable to any AVX2 CPU)
+EMBED_ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    seconds: float = 0.0
+    batch_size: int = 0
+    threads: int = 0
+    workers: int = 1
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 3),
+            "chunks_per_sec": round(self.chunks_per_sec, 1),
+            "batch_size": self.batch_size,
+            "threads": self.threads,
+            "workers": self.workers,
+        }
+
+
+class EmbeddingEngine:
+    """
+    Wraps a sentence-transformers model and turns a list of chunk texts
+    into an (n, dim) float32 matrix of L2-normalised vectors, ready for faiss.
+    """
+
+    def __init__(self, model, batch_size=None, num_threads=None, num_workers=None):
+        self.model = model
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+        self.num_threads = num_threads if num_threads is not None else DEFAULT_THREADS
+        self.num_workers = num_workers or DEFAULT_WORKERS
+        # One engine is shared by concurrent indexing jobs; each thread sees its own stats
+        self._local = threading.local()
+
+    @property
+    def last_stats(self) -> EmbeddingStats:
+        return getattr(self._local, "stats", None) or EmbeddingStats()
+
+    @last_stats.setter
+    def last_stats(self, stats):
+        self._local.stats = stats
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _set_threads(self):
+        import torch
+
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        return torch.get_num_threads()
+
+    def _use_pool(self, n):
+        # Spawning workers costs a few seconds; only worth it for big packs
+        return self.num_workers > 1 and n >= self.batch_size * self.num_workers
+
+    def embed(self, texts, progress=None) -> np.ndarray:
+        """
+        progress(done, total) is called after each batch. It needs the
+        in-process path, so it turns the multi-process pool off.
+        """
+        texts = list(texts)
+        stats = EmbeddingStats(
+            batch_size=self.batch_size,
+            threads=self._set_threads(),
+            workers=self.num_workers if progress is None and self._use_pool(len(texts)) else 1,
+        )
+
+        start = time.perf_counter()
+        if not texts:
+            vectors = np.zeros((0, self.dim), dtype=np.float32)
+        elif stats.workers > 1:
+            pool = self.model.start_multi_process_pool(["cpu"] * stats.workers)
+            try:
+                vectors = self.model.encode_multi_process(texts, pool, batch_size=self.batch_size)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+        elif progress is not None:
+            batches = []
+            for i in range(0, len(texts), self.batch_size):
+                batches.append(self.model.encode(
+                    texts[i : i + self.batch_size],
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                ))
+                progress(min(i + self.batch_size, len(texts)), len(texts))
+            vectors = np.concatenate(batches)
+        else:
+            vectors = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        stats.seconds = time.perf_counter() - start
+        stats.chunks = len(texts)
+        self.last_stats = stats
+
+        return normalize(vectors)
+
+
+def backend_model_kwargs(backend=None) -> dict:
+    """
+    SentenceTransformer keyword arguments that select an embedding backend.
+    """
+    backend = backend or EMBED_BACKEND
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBED_BACKENDS)}")
+    if backend == "torch":
+        return {}
+    if backend == "onnx":
+        return {"backend": "onnx"}
+    return {"backend": "onnx", "model_kwargs": {"file_name": EMBED_ONNX_INT8_FILE}}
+
+
+def vector_space(backend) -> str:
+    """
+    Backends whose vectors can share an index. torch and fp32 ONNX run the
+    same weights and agree to float rounding; quantized vectors do not.
+    Indexes without a recorded backend were built with torch.
+    """
+    backend = backend or "torch"
+    return "fp32" if backend in ("torch", "onnx") else backend
+
+
+def check_backend(recorded, path, backend=None):
+    """
+    Refuse to search or extend an index with vectors from another space.
+    """
+    backend = backend or EMBED_BACKEND
+    if vector_space(recorded) != vector_space(backend):
+        raise ValueError(
+            f"Index {path} was built with the {recorded or 'torch'!r} embedding backend, "
+            f"but EMBED_BACKEND is {backend!r}. Rebuild it or switch the backend back."
+        )
+
+
+def normalize(vectors) -> np.ndarray:
+    """
+    Contiguous float32 rows with unit L2 norm (zero rows are left as-is).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
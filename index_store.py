@@ -0,0 +1,843 @@
+# index_store.py — on-disk vector index format (faiss file + mmap chunk store)
+#
+# Layout of one index directory (e.g. outputs/HBR Case Study_index/):
+#   meta.json    small header: format version, model, dim, count, index_spec
+#   index.faiss  raw faiss index, memory-mapped where faiss supports it
+#   chunks.txt   every chunk's UTF-8 text concatenated into one blob
+#   offsets.npy  int64 byte offsets into chunks.txt (count + 1 entries)
+#   chunk_meta.npy  per-chunk page / character offsets / chunk id (optional)
+#   bm25.npz     keyword index over the same chunks (see sparse_index.py)
+#
+# meta.json is written last, so a directory without it is an unfinished save.
+
+import json
+import mmap
+import os
+import pickle
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ann_index import apply_search_settings, build_index, reconstruct_all, reconstruct_rows, search_parameters
+from diversity import MMR_FETCH_FACTOR, MMR_LAMBDA, mmr_select
+from embedding_engine import check_backend
+from query_cache import embed_queries, embed_query
+from sparse_index import BM25Index, rrf_fuse, rrf_scores
+from utils import file_lock
+
+
+FORMAT_NAME = "casestudy-index"
+FORMAT_VERSION = 1
+COLLECTION_FORMAT_NAME = "casestudy-collection"
+
+META_FILE = "meta.json"
+FAISS_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.txt"
+OFFSETS_FILE = "offsets.npy"
+CHUNK_META_FILE = "chunk_meta.npy"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+# Compact a collection once it has this many segments,
+# or once this fraction of its chunks belongs to deleted documents
+MAX_SEGMENTS = 8
+MAX_DELETED_FRACTION = 0.25
+# Segments dropped from the manifest stay on disk this long, for searches
+# and other processes still working from an older manifest
+RETIRED_SEGMENT_SECONDS = 600
+
+
+# ----------------------------------------------------
+# CHUNK STORE
+# ----------------------------------------------------
+# One record per chunk, from chunker.Chunk; page 0 means unknown
+CHUNK_META_DTYPE = np.dtype([
+    ("page", np.int32), ("end_page", np.int32),
+    ("start", np.int64), ("end", np.int64),
+    ("chunk_id", np.uint64),
+])
+
+
+class ChunkStore:
+    """
+    Chunk texts kept as one UTF-8 blob plus an offset array.
+    When opened from disk both are memory-mapped, so only the chunks
+    that are actually returned by a search are ever decoded.
+    """
+
+    def __init__(self, blob, offsets, meta=None):
+        self._blob = blob
+        self._offsets = offsets
+        self.meta = meta
+
+    @classmethod
+    def from_texts(cls, texts, meta=None):
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return cls(b"".join(encoded), offsets, meta)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """
+        From chunker.Chunk records, keeping their page and offset metadata.
+        """
+        meta = np.array(
+            [(c.page, c.end_page, c.start, c.end, int(c.chunk_id, 16)) for c in chunks],
+            dtype=CHUNK_META_DTYPE,
+        )
+        return cls.from_texts([c.text for c in chunks], meta)
+
+    @classmethod
+    def open(cls, path):
+        offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        blob = b""
+        if offsets[-1] > 0:
+            with open(os.path.join(path, CHUNKS_FILE), "rb") as f:
+                # The mapping stays valid after the file object is closed
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        meta_path = os.path.join(path, CHUNK_META_FILE)
+        meta = np.load(meta_path, mmap_mode="r") if os.path.exists(meta_path) else None
+        return cls(blob, offsets, meta)
+
+    def save(self, path):
+        with open(os.path.join(path, CHUNKS_FILE), "wb") as f:
+            f.write(self._blob[: int(self._offsets[-1])])
+        np.save(os.path.join(path, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        if self.meta is not None:
+            np.save(os.path.join(path, CHUNK_META_FILE), np.asarray(self.meta, dtype=CHUNK_META_DTYPE))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def text(self, i):
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def metadata(self, i):
+        """
+        Page, character offsets and chunk id of chunk i ({} if not recorded).
+        """
+        if self.meta is None or self.meta[i]["page"] == 0:
+            return {}
+        record = self.meta[i]
+        return {
+            "page": int(record["page"]),
+            "end_page": int(record["end_page"]),
+            "start": int(record["start"]),
+            "end": int(record["end"]),
+            "chunk_id": f"{int(record['chunk_id']):016x}",
+        }
+
+    def meta_rows(self, start, end):
+        """
+        Metadata records of rows start..end; zeros (unknown) if none are stored.
+        """
+        if self.meta is None:
+            return np.zeros(end - start, dtype=CHUNK_META_DTYPE)
+        return np.asarray(self.meta[start:end])
+
+
+# ----------------------------------------------------
+# INDEX
+# ----------------------------------------------------
+class CaseIndex:
+    """
+    A faiss index plus its chunk store and BM25 keyword index.
+    Exposes the same similarity_search() the LangChain FAISS store did,
+    and hybrid_search() fusing dense and keyword results.
+    """
+
+    def __init__(self, index, chunks: ChunkStore, embedding, meta=None, keywords=None):
+        self.index = index
+        self.chunks = chunks
+        self.embedding = embedding
+        self._keywords = keywords
+        self.meta = dict(meta or {})
+        # Indexes saved before ANN support are exact flat indexes
+        self.meta.setdefault("index_spec", {"kind": "flat"})
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def doc_id_for(self, row):
+        for doc_id, (start, end) in self.meta.get("docs", {}).items():
+            if start <= row < end:
+                return doc_id
+        return None
+
+    def document(self, row) -> Document:
+        doc_id = self.doc_id_for(row)
+        metadata = {"doc_id": doc_id} if doc_id is not None else {}
+        metadata.update(self.chunks.metadata(row))
+        return Document(page_content=self.chunks.text(row), metadata=metadata)
+
+    def search_rows(self, vector, k: int = 4, rows=None):
+        """
+        Returns [(distance, row)] nearest first. `rows` optionally restricts
+        the search to a list of (start, end) row ranges.
+        """
+        return self.search_rows_batch(np.asarray(vector).reshape(1, -1), k, rows)[0]
+
+    def search_rows_batch(self, vectors, k: int = 4, rows=None):
+        """
+        search_rows() for many query vectors in one faiss call.
+        Returns one [(distance, row)] list per query.
+        """
+        import faiss
+
+        queries = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.index.d)
+        if len(self) == 0:
+            return [[] for _ in queries]
+
+        params = None
+        if rows is not None:
+            ids = np.concatenate([np.arange(start, end, dtype=np.int64) for start, end in rows] or [[]]).astype(np.int64)
+            if len(ids) == 0:
+                return [[] for _ in queries]
+            if len(ids) < len(self):
+                params = search_parameters(self.index, self.meta["index_spec"], faiss.IDSelectorBatch(ids))
+            k = min(k, len(ids))
+
+        distances, ids = self.index.search(queries, min(k, len(self)), params=params)
+        return [
+            [(float(d), int(i)) for d, i in zip(row_d, row_i) if i >= 0]
+            for row_d, row_i in zip(distances, ids)
+        ]
+
+    def keyword_index(self) -> BM25Index:
+        # Indexes saved without bm25.npz get one built in memory on first use
+        if self._keywords is None:
+            self._keywords = BM25Index.from_texts([self.chunks.text(i) for i in range(len(self))])
+        return self._keywords
+
+    def keyword_rows(self, query: str, k: int = 4, rows=None):
+        """
+        Returns [(bm25 score, row)] best first.
+        """
+        return self.keyword_index().search_rows(query, k, rows)
+
+    def _rows_for(self, doc_ids):
+        if doc_ids is None:
+            return None
+        return [tuple(r) for doc_id, r in self.meta.get("docs", {}).items() if doc_id in doc_ids]
+
+    def similarity_search_by_vector(self, vector, k: int = 4, doc_ids=None) -> List[Document]:
+        return [self.document(row) for _, row in self.search_rows(vector, k, self._rows_for(doc_ids))]
+
+    def similarity_search(self, query: str, k: int = 4, doc_ids=None) -> List[Document]:
+        return self.similarity_search_by_vector(embed_query(self.embedding, query), k=k, doc_ids=doc_ids)
+
+    def hybrid_search(self, query: str, k: int = 4, doc_ids=None) -> List[Document]:
+        """
+        Dense and BM25 top-2k fused by reciprocal rank, top k kept.
+        """
+        return self.hybrid_search_batch([query], k, doc_ids)[0]
+
+    def similarity_search_batch(self, queries, k: int = 4, doc_ids=None) -> List[List[Document]]:
+        """
+        All queries embedded in one batch and searched in one faiss call.
+        """
+        vectors = embed_queries(self.embedding, queries)
+        hits = self.search_rows_batch(vectors, k, self._rows_for(doc_ids))
+        return [[self.document(row) for _, row in query_hits] for query_hits in hits]
+
+    def hybrid_search_batch(self, queries, k: int = 4, doc_ids=None, diversify=True) -> List[List[Document]]:
+        """
+        diversify=False skips MMR (plain fusion), e.g. when a reranker
+        reorders the results anyway.
+        """
+        queries = list(queries)
+        rows = self._rows_for(doc_ids)
+        dense = self.search_rows_batch(embed_queries(self.embedding, queries), 2 * k, rows)
+        results = []
+        for query, dense_hits in zip(queries, dense):
+            sparse_hits = self.keyword_rows(query, 2 * k, rows)
+            fused = _fuse(
+                [[r for _, r in dense_hits], [r for _, r in sparse_hits]], k, self.vectors_for, diversify
+            )
+            results.append([self.document(row) for row in fused])
+        return results
+
+    def vectors_for(self, rows):
+        return reconstruct_rows(self.index, self.meta["index_spec"], rows)
+
+    def document_texts(self, doc_ids=None, limit=None):
+        """
+        Chunk texts in index order, optionally only those of doc_ids.
+        """
+        rows = self._rows_for(doc_ids)
+        if rows is None:
+            rows = [(0, len(self))]
+
+        texts = []
+        for start, end in rows:
+            for row in range(start, end):
+                if limit is not None and len(texts) >= limit:
+                    return texts
+                texts.append(self.chunks.text(row))
+        return texts
+
+    def vectors(self):
+        """
+        All stored vectors as an (n, dim) float32 matrix (used when merging).
+        """
+        return reconstruct_all(self.index, self.meta["index_spec"])
+
+    def save(self, path):
+        """
+        Write to a temporary directory first, then swap it into place.
+        """
+        import faiss
+
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        faiss.write_index(self.index, os.path.join(tmp_path, FAISS_FILE))
+        self.chunks.save(tmp_path)
+        self.keyword_index().save(tmp_path)
+
+        meta = dict(self.meta)
+        meta.update({
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "dim": int(self.index.d),
+            "count": len(self),
+        })
+        with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, embedding):
+        import faiss
+
+        meta = read_meta(path)
+
+        index_file = os.path.join(path, FAISS_FILE)
+        # Flat / HNSW vector codes are mapped in place (MMAP_IFC) rather than
+        # copied to the heap; not every faiss build/index type supports mmap
+        flag_sets = [faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY, 0]
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            flag_sets.insert(0, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        for flags in flag_sets:
+            try:
+                index = faiss.read_index(index_file, flags)
+                break
+            except RuntimeError:
+                if not flags:
+                    raise
+
+        db = cls(index, ChunkStore.open(path), embedding, meta, BM25Index.open(path))
+        apply_search_settings(index, db.meta["index_spec"])
+        return db
+
+
+def _fuse(rankings, k, vectors_for, diversify=True):
+    """
+    Reciprocal rank fusion of dense and keyword rankings. Unless MMR is off
+    (MMR_LAMBDA=1 or diversify=False), k results are chosen from the top MMR_FETCH_FACTOR * k
+    by maximal marginal relevance, so near-identical chunks don't fill them.
+    vectors_for(keys) returns the stored vectors of candidate keys.
+    """
+    if not diversify or MMR_LAMBDA >= 1.0:
+        return rrf_fuse(rankings, k)
+
+    fused = rrf_scores(rankings)[: MMR_FETCH_FACTOR * k]
+    keys = [key for key, _ in fused]
+    if len(keys) <= k:
+        return keys
+    relevance = [score / fused[0][1] for _, score in fused]
+    return [keys[i] for i in mmr_select(relevance, vectors_for(keys), k)]
+
+
+def read_meta(path):
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"Index not found: {path}")
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if meta.get("format") != FORMAT_NAME:
+        raise ValueError(f"Not a case study index: {path}")
+    if meta.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(
+            f"Index {path} has format version {meta['version']}, "
+            f"this code reads up to {FORMAT_VERSION}. Please rebuild it."
+        )
+    return meta
+
+
+def is_index_dir(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def is_collection_dir(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+# ----------------------------------------------------
+# COLLECTION
+# ----------------------------------------------------
+# A collection is a directory of append-only segments (each a CaseIndex
+# directory) plus manifest.json, which records which documents live in
+# which row range of which segment. Adding a document writes a new
+# segment; deleting one only tombstones it in the manifest. compact()
+# later merges segments and drops tombstoned rows.
+# Segments taken out of the manifest are listed under "retired" and their
+# directories deleted by the first update RETIRED_SEGMENT_SECONDS later,
+# since a reader holding the old manifest may still load them.
+#
+#   {"format": "casestudy-collection", "version": 1, "next_segment": 3,
+#    "segments": [{"name": "seg-000001", "docs": {"A.pdf": [0, 120]}, "deleted": []}],
+#    "retired": [["seg-000002", <unix time>]],
+#    "sources": {"A.pdf": "<sha256 of the uploaded file>"}}
+
+# One lock per collection directory, shared by every Collection object
+# opened on it in this process
+_collection_locks = {}
+_collection_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _collection_lock(path):
+    """
+    Held around every manifest read-modify-write and segment name
+    allocation: a thread lock within this process, plus a file lock on
+    <collection>/.lock against other processes writing the same collection.
+    """
+    key = os.path.abspath(path)
+    with _collection_locks_guard:
+        lock = _collection_locks.setdefault(key, threading.Lock())
+    with lock, file_lock(os.path.join(key, LOCK_FILE)):
+        yield
+
+
+def _read_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Collection not found: {path}")
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != COLLECTION_FORMAT_NAME:
+        raise ValueError(f"Not a case study collection: {path}")
+    if manifest.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Collection {path} is newer than this code can read. Please rebuild it.")
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    tmp_path = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+
+def _drop_dead_segments(manifest):
+    """
+    Retire segments whose documents are all deleted (no merge needed for them).
+    """
+    dead = [seg["name"] for seg in manifest["segments"] if set(seg["docs"]) <= set(seg["deleted"])]
+    manifest["segments"] = [seg for seg in manifest["segments"] if seg["name"] not in dead]
+    _retire_segments(manifest, dead)
+
+
+def _retire_segments(manifest, names):
+    now = time.time()
+    manifest.setdefault("retired", []).extend([name, now] for name in names)
+
+
+def _expired_segments(manifest):
+    """
+    Take retired segments older than RETIRED_SEGMENT_SECONDS off the
+    manifest. Returns their names, for deleting the directories once the
+    manifest is written.
+    """
+    cutoff = time.time() - RETIRED_SEGMENT_SECONDS
+    retired = manifest.get("retired", [])
+    manifest["retired"] = [[name, when] for name, when in retired if when > cutoff]
+    return [name for name, when in retired if when <= cutoff]
+
+
+class Collection:
+    """
+    Many documents behind one similarity_search(), with per-document filtering.
+    """
+
+    def __init__(self, path, embedding):
+        self.path = path
+        self.embedding = embedding
+        self.manifest = _read_manifest(path)
+        self._segments = {}   # segment name -> opened CaseIndex
+        self._compaction = None
+
+    @classmethod
+    def open(cls, path, embedding, create=False):
+        if create and not is_collection_dir(path):
+            os.makedirs(path, exist_ok=True)
+            with _collection_lock(path):
+                if not is_collection_dir(path):
+                    _write_manifest(path, {
+                        "format": COLLECTION_FORMAT_NAME,
+                        "version": FORMAT_VERSION,
+                        "next_segment": 1,
+                        "segments": [],
+                    })
+        return cls(path, embedding)
+
+    def refresh(self):
+        self.manifest = _read_manifest(self.path)
+        names = {seg["name"] for seg in self.manifest["segments"]}
+        self._segments = {n: s for n, s in self._segments.items() if n in names}
+
+    def _segment(self, name) -> CaseIndex:
+        if name not in self._segments:
+            self._segments[name] = CaseIndex.load(os.path.join(self.path, name), self.embedding)
+        return self._segments[name]
+
+    def documents(self):
+        """
+        Live (not deleted) document ids, in the order they were added.
+        """
+        return [
+            doc_id
+            for seg in self.manifest["segments"]
+            for doc_id in seg["docs"]
+            if doc_id not in seg["deleted"]
+        ]
+
+    def __len__(self):
+        return sum(end - start for seg in self.manifest["segments"] for start, end in self._live_rows(seg))
+
+    @property
+    def embedding_backend(self):
+        """
+        Embedding backend of the stored vectors (None while empty).
+        Collections started before backends were recorded hold torch vectors.
+        """
+        recorded = self.manifest.get("embedding_backend")
+        return recorded or ("torch" if self.manifest["segments"] else None)
+
+    def source_hash(self, doc_id):
+        """
+        Content hash the document was indexed from, if it was recorded.
+        """
+        return self.manifest.get("sources", {}).get(doc_id)
+
+    def find_source(self, source_hash):
+        """
+        The live document indexed from content with this hash, or None.
+        """
+        for doc_id, digest in self.manifest.get("sources", {}).items():
+            if digest == source_hash:
+                return doc_id
+        return None
+
+    # ---------------- search ----------------
+    def _live_rows(self, seg, doc_ids=None):
+        return [
+            (start, end)
+            for doc_id, (start, end) in seg["docs"].items()
+            if doc_id not in seg["deleted"] and (doc_ids is None or doc_id in doc_ids)
+        ]
+
+    def search_rows(self, vector, k: int = 4, doc_ids=None):
+        """
+        Returns [(distance, segment name, row)] nearest first, across segments.
+        """
+        return self.search_rows_batch(np.asarray(vector).reshape(1, -1), k, doc_ids)[0]
+
+    def search_rows_batch(self, vectors, k: int = 4, doc_ids=None):
+        """
+        One faiss call per segment for all query vectors.
+        Returns one [(distance, segment name, row)] list per query.
+        """
+        if doc_ids is not None:
+            doc_ids = set(doc_ids)
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        hits = [[] for _ in range(len(vectors))]
+        for seg in self.manifest["segments"]:
+            rows = self._live_rows(seg, doc_ids)
+            if rows:
+                seg_hits = self._segment(seg["name"]).search_rows_batch(vectors, k, rows)
+                for query_hits, found in zip(hits, seg_hits):
+                    query_hits.extend((distance, seg["name"], row) for distance, row in found)
+        for query_hits in hits:
+            query_hits.sort(key=lambda h: h[0])
+            del query_hits[k:]
+        return hits
+
+    def keyword_rows(self, query: str, k: int = 4, doc_ids=None):
+        """
+        Returns [(bm25 score, segment name, row)] best first, across segments.
+        Each segment has its own IDF statistics, which is close enough for
+        ranking; the scores only feed rank fusion.
+        """
+        if doc_ids is not None:
+            doc_ids = set(doc_ids)
+
+        hits = []
+        for seg in self.manifest["segments"]:
+            rows = self._live_rows(seg, doc_ids)
+            if rows:
+                hits.extend(
+                    (score, seg["name"], row)
+                    for score, row in self._segment(seg["name"]).keyword_rows(query, k, rows)
+                )
+        hits.sort(key=lambda h: -h[0])
+        return hits[:k]
+
+    def document(self, segment_name, row) -> Document:
+        return self._segment(segment_name).document(row)
+
+    def document_texts(self, doc_ids=None, limit=None):
+        """
+        Chunk texts of live documents in insertion order, optionally only doc_ids.
+        """
+        doc_ids = set(doc_ids) if doc_ids is not None else None
+        texts = []
+        for seg in self.manifest["segments"]:
+            db = self._segment(seg["name"])
+            for start, end in self._live_rows(seg, doc_ids):
+                for row in range(start, end):
+                    if limit is not None and len(texts) >= limit:
+                        return texts
+                    texts.append(db.chunks.text(row))
+        return texts
+
+    def similarity_search_by_vector(self, vector, k: int = 4, doc_ids=None) -> List[Document]:
+        return [self.document(name, row) for _, name, row in self.search_rows(vector, k, doc_ids)]
+
+    def similarity_search(self, query: str, k: int = 4, doc_ids=None) -> List[Document]:
+        return self.similarity_search_by_vector(embed_query(self.embedding, query), k=k, doc_ids=doc_ids)
+
+    def hybrid_search(self, query: str, k: int = 4, doc_ids=None) -> List[Document]:
+        """
+        Dense and BM25 top-2k fused by reciprocal rank, top k kept.
+        """
+        return self.hybrid_search_batch([query], k, doc_ids)[0]
+
+    def similarity_search_batch(self, queries, k: int = 4, doc_ids=None) -> List[List[Document]]:
+        hits = self.search_rows_batch(embed_queries(self.embedding, queries), k, doc_ids)
+        return [[self.document(name, row) for _, name, row in query_hits] for query_hits in hits]
+
+    def hybrid_search_batch(self, queries, k: int = 4, doc_ids=None, diversify=True) -> List[List[Document]]:
+        queries = list(queries)
+        dense = self.search_rows_batch(embed_queries(self.embedding, queries), 2 * k, doc_ids)
+        results = []
+        for query, dense_hits in zip(queries, dense):
+            sparse_hits = self.keyword_rows(query, 2 * k, doc_ids)
+            fused = _fuse(
+                [[(n, r) for _, n, r in dense_hits], [(n, r) for _, n, r in sparse_hits]],
+                k, self.vectors_for, diversify,
+            )
+            results.append([self.document(name, row) for name, row in fused])
+        return results
+
+    def vectors_for(self, keys):
+        """
+        Stored vectors of (segment name, row) pairs, in the order given.
+        """
+        vectors = [None] * len(keys)
+        by_segment = {}
+        for i, (name, row) in enumerate(keys):
+            by_segment.setdefault(name, []).append((i, row))
+        for name, items in by_segment.items():
+            found = self._segment(name).vectors_for([row for _, row in items])
+            for (i, _), vector in zip(items, found):
+                vectors[i] = vector
+        return np.vstack(vectors)
+
+    # ---------------- updates ----------------
+    def add_document(self, doc_id, db: CaseIndex, source_hash=None):
+        """
+        Append one document's index as a new segment. A document that is
+        already present is replaced (its old rows are tombstoned).
+        source_hash is recorded in the same manifest write, so a document
+        is either fully added with its hash or not at all.
+        """
+        with _collection_lock(self.path):
+            manifest = _read_manifest(self.path)
+            backend = db.meta.get("embedding_backend") or "torch"
+            recorded = manifest.get("embedding_backend") or ("torch" if manifest["segments"] else backend)
+            check_backend(recorded, self.path, backend)
+            manifest["embedding_backend"] = recorded
+            name = f"seg-{manifest['next_segment']:06d}"
+
+            db.meta["docs"] = {doc_id: [0, len(db)]}
+            db.save(os.path.join(self.path, name))
+
+            for seg in manifest["segments"]:
+                if doc_id in seg["docs"] and doc_id not in seg["deleted"]:
+                    seg["deleted"].append(doc_id)
+            manifest["segments"].append({"name": name, "docs": {doc_id: [0, len(db)]}, "deleted": []})
+            manifest["next_segment"] += 1
+            sources = manifest.setdefault("sources", {})
+            if source_hash:
+                sources[doc_id] = source_hash
+            else:
+                sources.pop(doc_id, None)
+            _drop_dead_segments(manifest)
+            expired = _expired_segments(manifest)
+            _write_manifest(self.path, manifest)
+
+        self._remove_segments(expired)
+        self.refresh()
+        self.maybe_compact()
+
+    def delete_document(self, doc_id):
+        """
+        Tombstone a document: its rows stop matching at once. A segment
+        left with no live documents is retired right away; rows in shared
+        segments are physically removed by the next compaction.
+        """
+        with _collection_lock(self.path):
+            manifest = _read_manifest(self.path)
+            for seg in manifest["segments"]:
+                if doc_id in seg["docs"] and doc_id not in seg["deleted"]:
+                    seg["deleted"].append(doc_id)
+            manifest.get("sources", {}).pop(doc_id, None)
+            _drop_dead_segments(manifest)
+            expired = _expired_segments(manifest)
+            _write_manifest(self.path, manifest)
+
+        self._remove_segments(expired)
+        self.refresh()
+        self.maybe_compact()
+
+    def _remove_segments(self, names):
+        # Retired long enough ago that no reader should still load them
+        for name in names:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    # ---------------- compaction ----------------
+    def needs_compaction(self):
+        segments = self.manifest["segments"]
+        total = sum(end - start for seg in segments for start, end in seg["docs"].values())
+        deleted = total - len(self)
+        # Fully deleted segments never get here: they are dropped on delete
+        return len(segments) > MAX_SEGMENTS or (total > 0 and deleted / total > MAX_DELETED_FRACTION)
+
+    def maybe_compact(self):
+        if self.needs_compaction():
+            self.compact_in_background()
+
+    def compact_in_background(self):
+        """
+        Run compact() on a daemon thread; searches keep using the old
+        segments until the new manifest is written.
+        """
+        if self._compaction is not None and self._compaction.is_alive():
+            return self._compaction
+        self._compaction = threading.Thread(target=self.compact, name=f"compact:{self.path}", daemon=True)
+        self._compaction.start()
+        return self._compaction
+
+    def compact(self, index_spec=None):
+        """
+        Merge every segment into one, dropping deleted documents.
+        The merged index type follows index_spec ("auto" by default), so
+        a collection moves to ANN search once it grows large.
+        """
+        self.refresh()
+        merged_names = [seg["name"] for seg in self.manifest["segments"]]
+        if not merged_names:
+            return
+
+        texts, vectors, chunk_meta, docs, copied, meta = [], [], [], {}, set(), {}
+        for seg in self.manifest["segments"]:
+            db = self._segment(seg["name"])
+            seg_vectors = None
+            for doc_id, (start, end) in seg["docs"].items():
+                if doc_id in seg["deleted"]:
+                    continue
+                if seg_vectors is None:
+                    seg_vectors = db.vectors()
+                    meta = {
+                        k: v for k, v in db.meta.items()
+                        if k not in ("docs", "count", "dim", "embed_stats", "index_spec")
+                    }
+                docs[doc_id] = [len(texts), len(texts) + end - start]
+                copied.add((seg["name"], doc_id))
+                texts.extend(db.chunks.text(row) for row in range(start, end))
+                vectors.append(seg_vectors[start:end])
+                chunk_meta.append(db.chunks.meta_rows(start, end))
+
+        index = None
+        if texts:
+            index, spec = build_index(np.concatenate(vectors), index_spec)
+            meta["index_spec"] = spec.as_dict()
+
+        with _collection_lock(self.path):
+            manifest = _read_manifest(self.path)
+            if not set(merged_names) <= {seg["name"] for seg in manifest["segments"]}:
+                # Another compaction got there first
+                return
+            kept = [seg for seg in manifest["segments"] if seg["name"] not in merged_names]
+
+            # Deletions that landed while we were merging still apply
+            deleted = [
+                doc_id
+                for seg in manifest["segments"]
+                for doc_id in seg["deleted"]
+                if (seg["name"], doc_id) in copied
+            ]
+
+            new_segments = []
+            if index is not None:
+                name = f"seg-{manifest['next_segment']:06d}"
+                manifest["next_segment"] += 1
+                chunks = ChunkStore.from_texts(texts, np.concatenate(chunk_meta))
+                db = CaseIndex(index, chunks, self.embedding, meta)
+                db.meta["docs"] = docs
+                db.save(os.path.join(self.path, name))
+                new_segments.append({"name": name, "docs": docs, "deleted": deleted})
+
+            manifest["segments"] = new_segments + kept
+            _retire_segments(manifest, merged_names)
+            expired = _expired_segments(manifest)
+            _write_manifest(self.path, manifest)
+
+        self._remove_segments(expired)
+        self.refresh()
+
+
+# ----------------------------------------------------
+# LEGACY .pkl MIGRATION
+# ----------------------------------------------------
+def migrate_pickle(pkl_path, embedding, meta=None):
+    """
+    Convert an old pickled LangChain FAISS store into the directory layout.
+    The .pkl is removed once the new index is safely on disk.
+    """
+    with open(pkl_path, "rb") as f:
+        db = pickle.load(f)
+
+    # LangChain keeps faiss row -> docstore id -> Document
+    texts = []
+    for i in range(db.index.ntotal):
+        doc = db.docstore.search(db.index_to_docstore_id[i])
+        texts.append(doc.page_content)
+
+    new_path = pkl_path[: -len(".pkl")]
+    ci = CaseIndex(db.index, ChunkStore.from_texts(texts), embedding, meta)
+    ci.meta["migrated_from"] = os.path.basename(pkl_path)
+    ci.save(new_path)
+    os.remove(pkl_path)
+    return new_path
+
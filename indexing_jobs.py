@@ -0,0 +1,181 @@
+# indexing_jobs.py — background indexing of uploaded PDFs
+#
+# Streamlit runs the whole script for every interaction, so indexing inside
+# the script run froze that session until it was done. Jobs now run on a
+# thread pool shared by every session in the server process: the UI submits
+# a job, then polls job.snapshot() to draw page- and batch-level progress.
+# Jobs are identified by collection and content hash: submitting the same
+# content while its job is queued or running returns the existing job,
+# whatever the file is called.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_reader import iter_pdf_pages, page_count
+from chunker import iter_chunks
+from embedder import embed_and_build_index, add_to_collection
+from utils import file_sha256
+
+
+# Uploads indexed at the same time (queries don't wait on these threads)
+INDEX_JOB_WORKERS = int(os.getenv("INDEX_JOB_WORKERS", "2"))
+# Finished jobs kept around so every session can still read their result
+MAX_FINISHED_JOBS = 50
+
+# Share of the progress bar given to each stage
+EXTRACT_SHARE = 0.45
+EMBED_SHARE = 0.5
+
+
+class IndexJob:
+    """
+    One upload being indexed. Fields are written by the worker thread and
+    read by the UI through snapshot().
+    """
+
+    def __init__(self, key, collection_path, doc_id, pdf_path, source_hash):
+        self.key = key
+        self.collection_path = collection_path
+        self.doc_id = doc_id
+        self.pdf_path = pdf_path
+        self.source_hash = source_hash
+
+        self.status = "queued"      # queued / running / done / failed
+        self.stage = "Waiting for a free indexing worker..."
+        self.progress = 0.0
+        self.pages_done = 0
+        self.pages_total = 0
+        self.chunks_done = 0
+        self.chunks_total = 0
+        self.stats = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def _update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "key": self.key,
+                "doc_id": self.doc_id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self.progress, 3),
+                "pages_done": self.pages_done,
+                "pages_total": self.pages_total,
+                "chunks_done": self.chunks_done,
+                "chunks_total": self.chunks_total,
+                "stats": self.stats,
+                "error": self.error,
+            }
+
+    # ---------------- worker side ----------------
+    def _pages(self):
+        for page_no, text in iter_pdf_pages(self.pdf_path):
+            yield page_no, text
+            self._on_page(page_no)
+
+    def _on_page(self, page_no):
+        self._update(
+            pages_done=page_no,
+            progress=EXTRACT_SHARE * page_no / max(self.pages_total, 1),
+            stage=f"Extracting text: page {page_no} of {self.pages_total}",
+        )
+
+    def _on_batch(self, done, total):
+        self._update(
+            chunks_done=done,
+            progress=EXTRACT_SHARE + EMBED_SHARE * done / max(total, 1),
+            stage=f"Embedding chunks: {done} of {total}",
+        )
+
+    def run(self):
+        self._update(status="running", stage="Opening PDF...")
+        try:
+            self._update(pages_total=page_count(self.pdf_path))
+            # Pages are chunked as they are extracted
+            chunks = list(iter_chunks(self._pages()))
+            if not chunks:
+                raise ValueError("No text extracted (scanned or empty PDF?)")
+            self._update(chunks_total=len(chunks), progress=EXTRACT_SHARE)
+
+            db = embed_and_build_index(chunks, progress=self._on_batch)
+
+            self._update(stage="Saving to the vector collection...", progress=EXTRACT_SHARE + EMBED_SHARE)
+            add_to_collection(self.collection_path, self.doc_id, db, self.source_hash)
+
+            self._update(
+                status="done", stage="Indexing Complete! Ready to analyze.", progress=1.0,
+                chunks_done=len(chunks), stats=db.meta["embed_stats"], finished=time.time(),
+            )
+        except Exception as e:
+            self._update(status="failed", stage="Indexing failed.", error=str(e), finished=time.time())
+
+
+class IndexingQueue:
+
+    def __init__(self, max_workers=None):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or INDEX_JOB_WORKERS, thread_name_prefix="indexing"
+        )
+        self._jobs = {}   # key -> IndexJob
+        self._lock = threading.Lock()
+
+    def submit(self, collection_path, doc_id, pdf_path, source_hash=None) -> IndexJob:
+        """
+        Queue pdf_path for indexing into the collection as doc_id.
+        Returns the already active job if the same content is being indexed.
+        """
+        source_hash = source_hash or file_sha256(pdf_path)
+        key = f"{os.path.abspath(collection_path)}|{source_hash}"
+
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.done:
+                return job
+
+            job = IndexJob(key, collection_path, doc_id, pdf_path, source_hash)
+            self._jobs[key] = job
+            self._prune()
+        self._pool.submit(job.run)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def active_jobs(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.done]
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if j.done), key=lambda j: j.finished)
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.key]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_indexing_queue() -> IndexingQueue:
+    """
+    The process-wide queue, shared by every Streamlit session.
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = IndexingQueue()
+    return _queue
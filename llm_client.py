@@ -0,0 +1,260 @@
+# llm_client.py — shared asyncio LLM client: concurrency limit, timeouts, retries
+#
+# All Streamlit sessions in a process share one client. Requests run on a
+# single background event loop, so the Gemini handle (and its gRPC
+# channel) is created once and reused, and the semaphore caps how many
+# calls are in flight at once across every session.
+#
+# The transport is a "backend" object with one coroutine:
+#     async def generate(prompt, max_tokens, temperature) -> Optional[str]
+# returning the text, or None when the model produced no candidates.
+# Backends that can stream also have an async generator
+#     async def generate_stream(prompt, max_tokens, temperature)
+# yielding text pieces; the others are streamed as one piece.
+# GeminiBackend is the real one; HTTPBackend posts JSON to a URL so tests
+# can point LLM_BACKEND_URL at a local fake server.
+
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 16.0
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The request failed for good (not retryable, or out of retries)."""
+
+
+def _status_code(exc):
+    # google.api_core exceptions and urllib's HTTPError carry the HTTP status
+    # in .code, other HTTP clients use .status_code
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(exc)
+    if status in RETRYABLE_STATUS:
+        return True
+    # api_core names, without importing google.api_core here
+    return type(exc).__name__ in {
+        "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+        "InternalServerError", "DeadlineExceeded", "BadGateway",
+    }
+
+
+# ----------------------------------------------------
+# BACKENDS
+# ----------------------------------------------------
+class GeminiBackend:
+
+    def __init__(self, model_factory):
+        # model_factory() returns the shared GenerativeModel
+        self._model_factory = model_factory
+
+    async def generate(self, prompt, max_tokens, temperature):
+        response = await self._model_factory().generate_content_async(
+            prompt,
+            generation_config={
+                "max_output_tokens": max_tokens,
+                "temperature": temperature,
+            }
+        )
+        if not response.candidates:
+            return None
+        parts = response.candidates[0].content.parts
+        return "".join([p.text for p in parts if hasattr(p, "text")])
+
+    async def generate_stream(self, prompt, max_tokens, temperature):
+        response = await self._model_factory().generate_content_async(
+            prompt,
+            generation_config={
+                "max_output_tokens": max_tokens,
+                "temperature": temperature,
+            },
+            stream=True,
+        )
+        async for chunk in response:
+            if not chunk.candidates:
+                continue
+            piece = "".join([p.text for p in chunk.candidates[0].content.parts if hasattr(p, "text")])
+            if piece:
+                yield piece
+
+
+class HTTPBackend:
+    """
+    POSTs {"prompt", "max_tokens", "temperature"} as JSON and reads {"text"}.
+    timeout bounds the request itself; left as None, LLMClient sets it to
+    its own timeout so a cancelled call doesn't leave a worker thread waiting.
+    """
+
+    def __init__(self, url, timeout=None):
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, payload, timeout):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    async def generate(self, prompt, max_tokens, temperature):
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+        body = await asyncio.to_thread(self._post, payload, self.timeout or DEFAULT_TIMEOUT)
+        return body.get("text")
+
+
+# ----------------------------------------------------
+# CLIENT
+# ----------------------------------------------------
+class LLMClient:
+
+    def __init__(self, backend, max_concurrency=None, timeout=None, max_retries=None):
+        self.backend = backend
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        if getattr(backend, "timeout", 0) is None:
+            backend.timeout = self.timeout
+        self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+        self.retries = 0   # total retried attempts, for monitoring
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._semaphore = None
+
+    # ---------------- async API ----------------
+    async def agenerate(self, prompt, max_tokens=600, temperature=0.0):
+        """
+        Returns the text (None if the model gave no candidates).
+        Raises LLMError once retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self._limit():
+                    return await asyncio.wait_for(
+                        self.backend.generate(prompt, max_tokens, temperature), self.timeout
+                    )
+            except Exception as e:
+                attempt = await self._backoff(e, attempt)
+
+    async def astream(self, prompt, max_tokens=600, temperature=0.0):
+        """
+        Async generator of text pieces, under the same concurrency limit and
+        timeout (for the whole stream) as agenerate. Errors before the first
+        piece are retried like agenerate's; once text has been yielded a
+        failure raises LLMError, since the caller already has part of it.
+        """
+        if not hasattr(self.backend, "generate_stream"):
+            text = await self.agenerate(prompt, max_tokens, temperature)
+            if text:
+                yield text
+            return
+
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._limit():
+                    deadline = time.monotonic() + self.timeout
+                    pieces = self.backend.generate_stream(prompt, max_tokens, temperature).__aiter__()
+                    while True:
+                        try:
+                            piece = await asyncio.wait_for(
+                                pieces.__anext__(), max(0.0, deadline - time.monotonic())
+                            )
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield piece
+            except Exception as e:
+                if started:
+                    detail = "timed out" if isinstance(e, asyncio.TimeoutError) else e
+                    raise LLMError(detail) from e
+                attempt = await self._backoff(e, attempt)
+
+    def _limit(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _backoff(self, exc, attempt):
+        # Raises LLMError if exc is final, else sleeps and returns the next attempt number
+        if attempt >= self.max_retries or not is_retryable(exc):
+            detail = "timed out" if isinstance(exc, asyncio.TimeoutError) else exc
+            raise LLMError(detail) from exc
+        # Full jitter: spread retries out so sessions don't retry in lockstep
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        self.retries += 1
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+    # ---------------- sync API ----------------
+    def _event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True).start()
+            return self._loop
+
+    def generate(self, prompt, max_tokens=600, temperature=0.0):
+        """
+        Blocking wrapper for sync callers (Streamlit scripts, CLIs).
+        Every call runs on the client's own loop, so the semaphore and the
+        backend's connection are shared between threads.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate(prompt, max_tokens, temperature), self._event_loop()
+        )
+        return future.result()
+
+    def stream(self, prompt, max_tokens=600, temperature=0.0):
+        """
+        Blocking generator over astream() for sync callers. Pieces are
+        handed over from the client's loop as they arrive; closing the
+        generator early cancels the request.
+        """
+        pieces = queue.Queue()
+        end = object()
+
+        async def pump():
+            try:
+                async for piece in self.astream(prompt, max_tokens, temperature):
+                    pieces.put(piece)
+            except Exception as e:
+                pieces.put(e)
+            finally:
+                pieces.put(end)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._event_loop())
+        try:
+            while True:
+                item = pieces.get()
+                if item is end:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
@@ -1,45 +1,151 @@
 import pdfplumber
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_pdf_text(pdf_path):
+# Pages are extracted by this many processes (1 = in-process, serial)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "1"))
+# Pages handed to a worker per task
+PAGES_PER_TASK = 8
+
+
+def extract_pdf_text(pdf_path, workers=None, progress=None):
     """
     Extract text from PDF with layout=True to capture all lines,
     including quotes and indented 'exclusive' passages that default extraction misses.
+    progress(page_number) is called after each page.
+    """
+    cleaner = TextCleaner()
+    parts = []
+    for page_no, page_text in iter_raw_pages(pdf_path, workers):
+        parts.append(cleaner.feed(page_text + "\n"))
+        if progress is not None:
+            progress(page_no)
+    parts.append(cleaner.finish())
+    return "".join(parts)
+
+
+def page_count(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(pdf_path, workers=None):
     """
-    text = ""
+    Yield (page_number, cleaned_text) in page order, starting at 1.
+    Pages are produced as soon as they are extracted, so callers can start
+    chunking before the whole PDF is read.
+    """
+    for page_no, page_text in iter_raw_pages(pdf_path, workers):
+        yield page_no, clean_text(page_text)
+
+
+def iter_raw_pages(pdf_path, workers=None):
+    """
+    Yield (page_number, raw layout text). With workers > 1 page ranges are
+    split across a process pool; results still come back in order and at
+    most 2 ranges per worker are in flight, which bounds memory.
+    """
+    workers = workers or PDF_WORKERS
+
+    if workers <= 1:
+        yield from _iter_page_range(pdf_path, 0, None)
+        return
+
+    n_pages = page_count(pdf_path)
+    ranges = deque((s, min(s + PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PAGES_PER_TASK))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < 2 * workers:
+                start, end = ranges.popleft()
+                pending.append(pool.submit(_extract_page_range, pdf_path, start, end))
+            yield from pending.popleft().result()
+
 
+def _iter_page_range(pdf_path, start, end):
     with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
+        for i, page in enumerate(pdf.pages[start:end], start=start + 1):
             # layout=True is crucial!
             page_text = page.extract_text(layout=True) or ""
-            text += page_text + "\n"
+            # Free pdfplumber's per-page object cache as we go
+            page.close()
+            yield i, page_text
 
-    return clean_text(text)
 
+def _extract_page_range(pdf_path, start, end):
+    # Runs in a worker process
+    return list(_iter_page_range(pdf_path, start, end))
 
 
-def clean_text(text):
+_BLANK_LINES = re.compile(r"\n\n+")
+
+
+def _squeeze(line):
     """
-    Clean extracted text: remove page numbers, extra spaces, etc.
+    Strip a line and remove multiple spaces/tabs. Same result as
+    re.sub(r"[ \\t]+", " ", line).strip(), but split/join beats the
+    regex on layout text, where almost every line has padding.
+    """
+    line = line.strip()
+    if "\t" in line:
+        line = line.replace("\t", " ")
+    if "  " in line:
+        line = " ".join(filter(None, line.split(" ")))
+    return line
+
+
+class TextCleaner:
+    """
+    Streaming version of clean_text(): feed() text in pieces (e.g. one page
+    at a time) and concatenate what it returns. The result is identical to
+    clean_text() on the whole document, in one pass over the lines.
     """
-    # remove weird unicode
-    text = text.encode("ascii", "ignore").decode()
 
-    # remove multiple spaces
-    text = re.sub(r"[ \t]+", " ", text)
+    def __init__(self):
+        self._partial = ""        # unfinished last line of the previous feed()
+        self._started = False     # emitted a line yet?
+        self._blank = False       # saw blank line(s) since the last emitted line
 
-    cleaned = []
-    for line in text.split("\n"):
-        # remove lines that are only page numbers
-        if not re.match(r"^\s*\d+\s*$", line.strip()):
-            cleaned.append(line.strip())
+    def feed(self, text):
+        # remove weird unicode
+        text = text.encode("ascii", "ignore").decode()
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        return self._clean_lines(lines)
 
-    text = "\n".join(cleaned)
+    def finish(self):
+        out = self._clean_lines([self._partial])
+        self._partial = ""
+        return out
 
-    # collapse blank lines
-    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    def _clean_lines(self, lines):
+        # remove lines that are only page numbers (blank lines are kept for now)
+        kept = [line for line in map(_squeeze, lines) if not line.isdigit()]
+        if not kept:
+            return ""
 
-    return text.strip()
+        # collapse blank lines; leading/trailing ones are dropped
+        body = _BLANK_LINES.sub("\n\n", "\n".join(kept)).strip("\n")
+        if not body:
+            self._blank = True
+            return ""
+
+        out = body
+        if self._started:
+            out = ("\n\n" if self._blank or not kept[0] else "\n") + body
+        self._started = True
+        self._blank = not kept[-1]
+        return out
+
+
+def clean_text(text):
+    """
+    Clean extracted text: remove page numbers, extra spaces, etc.
+    """
+    cleaner = TextCleaner()
+    return cleaner.feed(text) + cleaner.finish()
 
 
 def save_text(path, text):
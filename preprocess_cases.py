@@ -1,60 +1,216 @@
+# preprocess_cases.py — batch ingestion of case PDFs into the collection
+#
+# Usage:
+#   python preprocess_cases.py sample_cases/ ["more/*.pdf" ...] [--collection outputs/case_collection]
+#       [--workers 4] [--text-dir outputs] [--force]
+#
+# Extraction and chunking run in a process pool with at most 2 files per
+# worker in flight. Embedding and indexing run in this process as results
+# come back, so they overlap with the extraction of the next files.
+# A file whose SHA-256 matches the hash recorded in the collection is
+# skipped. Files are keyed by name, so inputs sharing a file name are
+# refused before anything is ingested. Each document is committed to the
+# collection on its own, so an interrupted run is resumed by running the
+# same command again.
+
+import argparse
+import glob
 import os
-from pdf_reader import extract_pdf_text, save_text
-from embedder import chunk_text, embed_and_build_index, save_index, load_index
-
-BASE = r"D:\ADANI CLG\TRI 2\CLASS\GENAI\Assignment\CaseStudySummarizer"
-
-sample_path = BASE + "\\sample_cases"
-print("Available PDFs:")
-for f in os.listdir(sample_path):
-    print(" -", f)
-
-files = [
-    "HBR Case Study.pdf",
-    "Ferrari 2025 Case.pdf",
-    "Tesla Case.pdf"
-]
-
-for f in files:
-    pdf_path = sample_path + "\\" + f
-    print("\n⏳ Extracting text from:", f)
-
-    text = extract_pdf_text(pdf_path)
-
-    out_path = BASE + "\\outputs\\" + f.replace(".pdf", ".txt")
-    save_text(out_path, text)
-
-    print("✔ Saved cleaned text →", out_path)
-
-for f in files:
-    txt_path = BASE + "\\outputs\\" + f.replace(".pdf", ".txt")
-    
-    with open(txt_path, "r", encoding="utf-8") as file:
-        text = file.read()
-
-    print("\n📌 Processing:", f)
-
-    chunks = chunk_text(text)
-    print("✔ Total chunks created:", len(chunks))
-
-    index_path = BASE + "\\outputs\\" + f.replace(".pdf", "_index.pkl")
-
-    db = embed_and_build_index(chunks)
-    save_index(db, index_path)
-
-    print("✔ Vector store saved at:", index_path)
-
-test_index = BASE + "\\outputs\\HBR Case Study_index.pkl"
-
-query = "What is the main challenge discussed in this case?"
-
-db = load_index(test_index)
-results = db.similarity_search(query, k=3)
-
-print("🔎 QUERY:", query)
-print("\n📌 Top Retrieved Chunks:")
-
-for i, r in enumerate(results):
-    print(f"\n----- Chunk {i+1} -----")
-    print(r.page_content[:800])
-
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections import deque
+
+from pdf_reader import iter_pdf_pages
+from chunker import iter_chunks
+from embedder import embed_and_build_index, add_to_collection, open_collection, COLLECTION_DIR_NAME
+from utils import file_sha256
+
+
+STAGES = ("hash", "extract", "chunk", "embed", "index")
+
+
+def find_pdfs(patterns):
+    """
+    Expand directories (their *.pdf files), globs and plain paths, in order, without duplicates.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, "*.pdf")))
+        else:
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(p for p in matches if p.lower().endswith(".pdf"))
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def extract_and_chunk(pdf_path, text_dir=None):
+    # Runs in a worker process; pages are read serially there and chunked
+    # as they come, so the two stages are timed by splitting the total
+    extract_seconds = 0.0
+    text_file = None
+    if text_dir:
+        name = os.path.splitext(os.path.basename(pdf_path))[0] + ".txt"
+        text_file = open(os.path.join(text_dir, name), "w", encoding="utf-8")
+
+    def pages():
+        nonlocal extract_seconds
+        page_iter = iter_pdf_pages(pdf_path, workers=1)
+        while True:
+            start = time.perf_counter()
+            page = next(page_iter, None)
+            extract_seconds += time.perf_counter() - start
+            if page is None:
+                return
+            if text_file:
+                text_file.write(page[1] + "\n\n")
+            yield page
+
+    start = time.perf_counter()
+    try:
+        chunks = list(iter_chunks(pages()))
+    finally:
+        if text_file:
+            text_file.close()
+    total = time.perf_counter() - start
+    return chunks, {"extract": extract_seconds, "chunk": total - extract_seconds}
+
+
+def check_doc_ids(paths):
+    """
+    The file name is the document's key in the collection, so two inputs
+    with the same name would overwrite each other. Raises ValueError.
+    """
+    seen = {}
+    for path in paths:
+        seen.setdefault(os.path.basename(path), []).append(path)
+    clashes = {name: found for name, found in seen.items() if len(found) > 1}
+    if clashes:
+        lines = "\n".join(f"  {name}: {', '.join(found)}" for name, found in sorted(clashes.items()))
+        raise ValueError(f"PDFs with the same file name would replace each other:\n{lines}")
+
+
+def ingest(paths, collection_path, workers=1, text_dir=None, force=False):
+    check_doc_ids(paths)
+    seconds = dict.fromkeys(STAGES, 0.0)
+    totals = {"files": 0, "bytes": 0, "chunks": 0, "duplicates": 0, "skipped": 0, "failed": 0}
+    wall_start = time.perf_counter()
+
+    collection = open_collection(collection_path)
+    todo = deque()
+    for path in paths:
+        start = time.perf_counter()
+        digest = file_sha256(path)
+        seconds["hash"] += time.perf_counter() - start
+
+        doc_id = os.path.basename(path)
+        if not force and collection.source_hash(doc_id) == digest:
+            print("⏭  Unchanged, skipping:", doc_id)
+            totals["skipped"] += 1
+            continue
+        todo.append((path, doc_id, digest))
+
+    if text_dir:
+        os.makedirs(text_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while todo or pending:
+            while todo and len(pending) < 2 * workers:
+                path, doc_id, digest = todo.popleft()
+                pending[pool.submit(extract_and_chunk, path, text_dir)] = (path, doc_id, digest)
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, doc_id, digest = pending.pop(future)
+                try:
+                    chunks, stage_seconds = future.result()
+                except Exception as e:
+                    print(f"❌ Extraction failed for {doc_id}: {e}")
+                    totals["failed"] += 1
+                    continue
+
+                for stage, value in stage_seconds.items():
+                    seconds[stage] += value
+                if not chunks:
+                    print("⚠️ No text extracted, skipping:", doc_id)
+                    totals["failed"] += 1
+                    continue
+
+                start = time.perf_counter()
+                db = embed_and_build_index(chunks)
+                seconds["embed"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                add_to_collection(collection_path, doc_id, db, digest)
+                seconds["index"] += time.perf_counter() - start
+
+                totals["files"] += 1
+                totals["bytes"] += os.path.getsize(path)
+                totals["chunks"] += len(chunks)
+                stats = db.meta["embed_stats"]
+                totals["duplicates"] += stats["duplicates"]
+                print(
+                    f"✔ {doc_id}: {len(chunks)} chunks ({stats['duplicates']} near-duplicates dropped, "
+                    f"{stats['cached']} from embedding cache)"
+                )
+
+    # Merge the new segments now instead of on a thread that dies with us
+    collection = open_collection(collection_path)
+    if collection.needs_compaction():
+        collection.compact()
+
+    print_report(seconds, totals, time.perf_counter() - wall_start)
+    return totals
+
+
+def print_report(seconds, totals, wall):
+    mb = totals["bytes"] / 1e6
+    rates = {
+        "hash": "",
+        "extract": f"{mb / seconds['extract']:.2f} MB/s" if seconds["extract"] else "",
+        "chunk": f"{totals['chunks'] / seconds['chunk']:.0f} chunks/s" if seconds["chunk"] else "",
+        "embed": f"{totals['chunks'] / seconds['embed']:.1f} chunks/s" if seconds["embed"] else "",
+        "index": f"{totals['files'] / seconds['index']:.2f} files/s" if seconds["index"] else "",
+    }
+
+    print(f"\n{'stage':<10}{'seconds':>10}  throughput")
+    for stage in STAGES:
+        print(f"{stage:<10}{seconds[stage]:>10.2f}  {rates[stage]}")
+    # extract/chunk are summed over workers, so they can exceed the wall time
+    print(f"{'wall':<10}{wall:>10.2f}  {totals['files'] / wall:.2f} files/s")
+    print(
+        f"\n📌 {totals['files']} ingested ({totals['chunks']} chunks, {totals['duplicates']} near-duplicates dropped, "
+        f"{mb:.1f} MB), "
+        f"{totals['skipped']} unchanged, {totals['failed']} failed"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract, chunk, embed and index case PDFs.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns.")
+    parser.add_argument("--collection", default=os.path.join("outputs", COLLECTION_DIR_NAME))
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Extraction processes.")
+    parser.add_argument("--text-dir", help="Also save each case's cleaned text here.")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if unchanged.")
+    args = parser.parse_args(argv)
+
+    paths = find_pdfs(args.inputs)
+    if not paths:
+        print("No PDFs found.")
+        return 1
+
+    try:
+        check_doc_ids(paths)
+    except ValueError as e:
+        print("❌", e)
+        return 1
+
+    print(f"⏳ Ingesting {len(paths)} PDFs with {args.workers} workers →", args.collection)
+    totals = ingest(paths, args.collection, args.workers, args.text_dir, args.force)
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+# query_cache.py — query-embedding memo and semantic answer cache
+#
+# Every question used to be embedded again on each retrieval, and a
+# rephrased question went through retrieval and the Gemini calls again.
+#   embed_queries()   LRU memo of query vectors, keyed by model and text
+#   SemanticCache     answers of one loaded index; a question whose vector
+#                     is within SEMANTIC_CACHE_THRESHOLD cosine similarity
+#                     of a cached one gets that answer and its docs back
+#
+# Questions that differ only in a number, year or name ("revenue in 2019"
+# vs "revenue in 2020") embed very close together, so a cached answer is
+# only served when those key terms (see key_terms()) match exactly. The
+# answer cache is still opt-in: SEMANTIC_CACHE=1 turns it on.
+#
+# Semantic caches hang off the loaded index object (like the case
+# summaries in rag_pipeline.py). A rebuilt, updated or deleted index is
+# loaded as a new object, so its old answers are never served.
+
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Query vectors remembered per process (0 = off)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+# SEMANTIC_CACHE=1 turns the answer cache on
+USE_SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "0") == "1"
+# Minimum cosine similarity for two questions to share an answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Answers kept per loaded index (oldest dropped first)
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+
+
+# ----------------------------------------------------
+# QUERY EMBEDDING MEMO
+# ----------------------------------------------------
+_query_vectors = OrderedDict()   # (model name, text) -> float32 vector
+_query_lock = threading.Lock()
+_query_stats = {"hits": 0, "misses": 0}
+
+
+def _model_key(embedding):
+    # model_kwargs tell the embedding backends apart (see embedding_engine.py)
+    name = getattr(embedding, "model_name", None) or type(embedding).__name__
+    return f"{name}|{getattr(embedding, 'model_kwargs', None)!r}"
+
+
+def embed_queries(embedding, queries) -> np.ndarray:
+    """
+    (n, dim) float32 query vectors. Only texts not seen recently are
+    embedded, all of them in one embed_documents() batch.
+    """
+    queries = list(queries)
+    model = _model_key(embedding)
+    found = {}
+    with _query_lock:
+        for text in queries:
+            vector = _query_vectors.get((model, text))
+            if vector is not None:
+                _query_vectors.move_to_end((model, text))
+                found[text] = vector
+        _query_stats["hits"] += sum(1 for text in queries if text in found)
+
+    missing = list(dict.fromkeys(text for text in queries if text not in found))
+    if missing:
+        vectors = np.asarray(embedding.embed_documents(missing), dtype=np.float32)
+        with _query_lock:
+            _query_stats["misses"] += len(missing)
+            for text, vector in zip(missing, vectors):
+                found[text] = vector
+                if QUERY_EMBED_CACHE_SIZE > 0:
+                    _query_vectors[(model, text)] = vector
+            while len(_query_vectors) > QUERY_EMBED_CACHE_SIZE:
+                _query_vectors.popitem(last=False)
+
+    return np.vstack([found[text] for text in queries])
+
+
+def embed_query(embedding, query) -> np.ndarray:
+    return embed_queries(embedding, [query])[0]
+
+
+def query_memo_stats():
+    with _query_lock:
+        lookups = _query_stats["hits"] + _query_stats["misses"]
+        return {
+            **_query_stats,
+            "hit_rate": round(_query_stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": len(_query_vectors),
+        }
+
+
+# ----------------------------------------------------
+# SEMANTIC ANSWER CACHE
+# ----------------------------------------------------
+# Shared by every SemanticCache, for the UI
+_semantic_stats = {"hits": 0, "misses": 0}
+_semantic_stats_lock = threading.Lock()
+
+# Numbers (years, amounts, percentages) and capitalized words (names, parties)
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+_NAME_RE = re.compile(r"\b[A-Z][\w&'-]*")
+
+
+def key_terms(text: str) -> frozenset:
+    """
+    Terms two questions must share to get the same answer: every number,
+    and every capitalized word other than the one starting the question.
+    """
+    text = text.strip()
+    first = re.match(r"[\w&'-]*", text).group()
+    names = [m.group() for m in _NAME_RE.finditer(text) if m.start() > 0 or m.group() != first]
+    return frozenset(_NUMBER_RE.findall(text)) | frozenset(n.lower() for n in names if n != "I")
+
+
+class SemanticCache:
+    """
+    Answers of one index. Entries only match questions asked with the same
+    scope (document filter and pipeline mode) and the same key_terms().
+    """
+
+    def __init__(self, threshold=None, max_entries=None):
+        self.threshold = SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = SEMANTIC_CACHE_SIZE if max_entries is None else max_entries
+        self._entries = []     # (scope, key terms, answer, docs), oldest first
+        self._vectors = None   # unit vectors, one row per entry
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, vector, scope, text=""):
+        """
+        (answer, docs) of the most similar cached question in scope with
+        the same key terms as text, or None if none is within the threshold.
+        """
+        vector = _unit(vector)
+        terms = key_terms(text)
+        with self._lock:
+            best = None
+            if self._entries:
+                similarity = self._vectors @ vector
+                for i in np.argsort(-similarity):
+                    if similarity[i] < self.threshold:
+                        break
+                    if self._entries[i][:2] == (scope, terms):
+                        best = self._entries[i][2:]
+                        break
+        _count("hits" if best is not None else "misses")
+        return best
+
+    def put(self, vector, scope, answer, docs, text=""):
+        vector = _unit(vector).reshape(1, -1)
+        with self._lock:
+            self._entries.append((scope, key_terms(text), answer, list(docs)))
+            self._vectors = vector if self._vectors is None else np.vstack([self._vectors, vector])
+            if len(self._entries) > self.max_entries:
+                drop = len(self._entries) - self.max_entries
+                del self._entries[:drop]
+                self._vectors = self._vectors[drop:]
+
+    def clear(self):
+        with self._lock:
+            self._entries, self._vectors = [], None
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _count(outcome):
+    with _semantic_stats_lock:
+        _semantic_stats[outcome] += 1
+
+
+# loaded index -> SemanticCache; dropped together with the index object
+_semantic_caches = weakref.WeakKeyDictionary()
+_semantic_caches_lock = threading.Lock()
+
+
+def semantic_cache_for(db) -> SemanticCache:
+    with _semantic_caches_lock:
+        cache = _semantic_caches.get(db)
+        if cache is None:
+            cache = _semantic_caches[db] = SemanticCache()
+        return cache
+
+
+def drop_semantic_cache(db):
+    """
+    Forget the answers of an index that was rebuilt, changed or deleted,
+    even if something still holds on to the old index object.
+    """
+    with _semantic_caches_lock:
+        _semantic_caches.pop(db, None)
+
+
+def semantic_cache_stats():
+    with _semantic_stats_lock:
+        stats = dict(_semantic_stats)
+    with _semantic_caches_lock:
+        stats["entries"] = sum(len(cache) for cache in _semantic_caches.values())
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
@@ -1,110 +1,254 @@
 # rag_pipeline.py — STRICT RAG FOR COLLEGE ASSIGNMENTS (FINAL)
 
 import os
-from typing import List, Tuple
-
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import weakref
+from typing import Iterator, List, Tuple
 
 from langchain_core.documents import Document
-from embedder import load_index
+from context_packer import pack_context
+from embedder import get_index
+from llm_cache import ResponseCache, response_key
+from llm_client import GeminiBackend, HTTPBackend, LLMClient, LLMError
+from query_cache import USE_SEMANTIC_CACHE, embed_queries, semantic_cache_for
+from reranker import RERANK_TOP_K, USE_RERANK, two_stage
+
+
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+
+# Built on first use by get_gemini_model(); importing this module stays cheap
+_gemini_model = None
+_gemini_lock = threading.Lock()
+
+# Successful responses are cached on disk (see llm_cache.py); LLM_CACHE=0 turns it off
+USE_RESPONSE_CACHE = os.getenv("LLM_CACHE", "1") != "0"
+_response_cache = None
+
+# Shared by every session (see llm_client.py). LLM_BACKEND_URL swaps Gemini
+# for an HTTP endpoint, e.g. a local fake server in tests.
+_llm_client = None
+
+# Fuse BM25 keyword hits into retrieval; HYBRID_SEARCH=0 is dense only
+USE_HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+
+# Questions answered in parallel by answer_queries()
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+
+# How answer_query talks to Gemini:
+#   "single"       one answer call over the retrieved chunks
+#   "case_summary" one answer call plus a summary computed once per case
+#   "two_pass"     summarize the retrieved chunks, then answer (two serial calls)
+PIPELINE_MODES = ("single", "case_summary", "two_pass")
+DEFAULT_PIPELINE_MODE = os.getenv("RAG_MODE", "single")
+
+# Chunks from the start of a case that go into its one-off summary
+SUMMARY_CHUNKS = 15
+
+# loaded index -> {doc_ids: summary}; dropped together with the index object
+_case_summaries = weakref.WeakKeyDictionary()
 
 
 # ----------------------------------------------------
 # LOAD API KEY
 # ----------------------------------------------------
-import os
-import streamlit as st
-from dotenv import load_dotenv
+def load_api_key() -> str:
+    import streamlit as st
+    from dotenv import load_dotenv
+
+    # Load .env (local only)
+    load_dotenv()
+
+    api_key = None
 
-# Load .env (local only)
-load_dotenv()
+    # 1. Check Streamlit Cloud's secrets (won't error locally)
+    try:
+        api_key = st.secrets["GOOGLE_API_KEY"]
+    except Exception:
+        pass
 
-api_key = None
+    # 2. If not found, check local .env
+    if not api_key:
+        api_key = os.getenv("GOOGLE_API_KEY")
 
-# 1. Check Streamlit Cloud's secrets (won't error locally)
-try:
-    api_key = st.secrets["GOOGLE_API_KEY"]
-except Exception:
-    pass
+    # 3. Fail if no API key found
+    if not api_key:
+        raise ValueError("❌ GOOGLE_API_KEY not found in secrets or .env")
 
-# 2. If not found, check local .env
-if not api_key:
-    api_key = os.getenv("GOOGLE_API_KEY")
+    return api_key
 
-# 3. Fail if no API key found
-if not api_key:
-    raise ValueError("❌ GOOGLE_API_KEY not found in secrets or .env")
 
-# Configure Gemini
-genai.configure(api_key=api_key)
+def get_gemini_model():
+    """
+    Configures Gemini and builds the model handle once per process.
+    """
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_lock:
+            if _gemini_model is None:
+                import google.generativeai as genai
 
+                genai.configure(api_key=load_api_key())
+                _gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _gemini_model
 
 
+def get_llm_client() -> LLMClient:
+    global _llm_client
+    if _llm_client is None:
+        with _gemini_lock:
+            if _llm_client is None:
+                url = os.getenv("LLM_BACKEND_URL")
+                backend = HTTPBackend(url) if url else GeminiBackend(get_gemini_model)
+                _llm_client = LLMClient(backend)
+    return _llm_client
+
+
+def set_llm_client(client: LLMClient):
+    """
+    Replace the shared client (tests, benchmarks, alternative backends).
+    """
+    global _llm_client
+    _llm_client = client
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        with _gemini_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
+
 
 # ----------------------------------------------------
 # GEMINI CALL
 # ----------------------------------------------------
-def gemini_generate(prompt: str, max_tokens: int = 600):
-    model = genai.GenerativeModel("gemini-2.0-flash")
-
+def gemini_generate(prompt: str, max_tokens: int = 600, temperature: float = 0.0):
+    # temperature 0.0: STRICT, no creativity
+    cache = get_response_cache() if USE_RESPONSE_CACHE else None
+    if cache is not None:
+        key = response_key(GEMINI_MODEL_NAME, prompt, max_tokens, temperature)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Timeouts, 429/5xx retries and the concurrency limit live in the client
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": max_tokens,
-                "temperature": 0.0,  # STRICT, no creativity
-            }
-        )
-    except Exception as e:
+        text = get_llm_client().generate(prompt, max_tokens, temperature)
+    except LLMError as e:
         return f"⚠️ Gemini API Error: {e}"
 
-    if not response.candidates:
+    if text is None:
         return "⚠️ No output."
 
-    parts = response.candidates[0].content.parts
-    text = "".join([p.text for p in parts if hasattr(p, "text")])
+    if not text:
+        return "⚠️ Empty output."
 
-    return text.strip() if text else "⚠️ Empty output."
+    # Only real answers are cached; errors and empty outputs are retried next time
+    text = text.strip()
+    if cache is not None and text:
+        cache.put(key, GEMINI_MODEL_NAME, text)
+    return text
+
+
+def gemini_generate_stream(prompt: str, max_tokens: int = 600, temperature: float = 0.0) -> Iterator[str]:
+    """
+    Same as gemini_generate, but yields text pieces as Gemini produces them.
+    A cached response is yielded in one piece.
+    """
+    cache = get_response_cache() if USE_RESPONSE_CACHE else None
+    if cache is not None:
+        key = response_key(GEMINI_MODEL_NAME, prompt, max_tokens, temperature)
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    # Same concurrency limit, timeout and retries as gemini_generate
+    pieces = []
+    try:
+        for piece in get_llm_client().stream(prompt, max_tokens, temperature):
+            # Leading whitespace would be stripped by gemini_generate too
+            if not pieces:
+                piece = piece.lstrip()
+                if not piece:
+                    continue
+            pieces.append(piece)
+            yield piece
+    except LLMError as e:
+        yield f"⚠️ Gemini API Error: {e}"
+        return
+
+    text = "".join(pieces).strip()
+    if not text:
+        yield "⚠️ Empty output."
+        return
+
+    if cache is not None:
+        cache.put(key, GEMINI_MODEL_NAME, text)
 
 
 # ----------------------------------------------------
 # 1. RETRIEVE CHUNKS
 # ----------------------------------------------------
-def retrieve_docs(index_path: str, query: str, k: int = 15) -> List[Document]:
+def _search_batch(db, queries: List[str], k: int, doc_ids=None, diversify=True) -> List[List[Document]]:
+    if USE_HYBRID_SEARCH:
+        return db.hybrid_search_batch(queries, k=k, doc_ids=doc_ids, diversify=diversify)
+    return db.similarity_search_batch(queries, k=k, doc_ids=doc_ids)
+
+
+def retrieve_docs(index_path: str, query: str, k: int = 15, doc_ids=None) -> List[Document]:
     """
     k=15 gives very stable retrieval.
-    Keyword fallback ensures accuracy (Ferrari exclusivity chunk always loads).
+    Dense and BM25 keyword results are fused (see sparse_index.py), so
+    exact-term chunks (Ferrari exclusivity chunk) always load.
+    With reranking on (see reranker.py) RERANK_CANDIDATES chunks are
+    recalled and only the best min(k, RERANK_TOP_K) are kept.
+    doc_ids restricts a collection search to those documents.
+    """
+    return retrieve_docs_batch(index_path, [query], k, doc_ids)[0]
+
+
+def retrieve_docs_batch(index_path: str, queries: List[str], k: int = 15, doc_ids=None) -> List[List[Document]]:
+    """
+    retrieve_docs() for many questions: one embedding batch, one faiss
+    search and one reranker batch for all of them. Repeated questions are
+    searched once. Returns the docs for each query, in the order given.
     """
     if not os.path.exists(index_path):
         raise FileNotFoundError(f"Index not found: {index_path}")
 
-    db = load_index(index_path)
-    
-    # Primary retrieval
-    docs = db.similarity_search(query, k=k)
-
-    # Keyword fallback for weak embeddings
-    if len(docs) < 5:
-        main_keyword = query.split()[0]
-        fallback_docs = db.similarity_search(main_keyword, k=k)
-        docs = fallback_docs if len(fallback_docs) > len(docs) else docs
+    # Served from the in-process cache; only reads the disk when the file changed
+    db = get_index(index_path)
+    unique = list(dict.fromkeys(queries))
+    if USE_RERANK:
+        # Recall is plain fusion: the cross-encoder reorders it anyway, so MMR would be wasted
+        results = two_stage(
+            unique,
+            lambda qs, n: _search_batch(db, qs, max(n, k), doc_ids, diversify=False),
+            top_k=min(k, RERANK_TOP_K),
+        )
+    else:
+        results = _search_batch(db, unique, k, doc_ids)
 
-    return docs
+    by_query = dict(zip(unique, results))
+    return [by_query[q] for q in queries]
 
 
 # ----------------------------------------------------
 # 2. SUMMARIZE CONTEXT STRICTLY
 # ----------------------------------------------------
-def condense_context(docs: List[Document]) -> Tuple[str, str]:
+def condense_context(docs: List[Document], query: str = None) -> Tuple[str, str]:
+    """
+    Returns (summary, raw_docs); raw_docs is the packed context
+    (see context_packer.py) that the summary was written from.
+    """
 
     if not docs:
         return "The retrieved context is insufficient to summarize.", ""
 
-    raw_docs = "\n\n".join(
-        f"[DOC {i+1}]\n{d.page_content}"
-        for i, d in enumerate(docs)
-    )
+    raw_docs, _ = pack_context(docs, query)
 
     prompt = f"""
 You are a STRICT RAG system. Summarize ONLY using the text below.
@@ -127,19 +271,34 @@ RULES:
     return summary, raw_docs
 
 
+def case_summary(index_path: str, doc_ids=None) -> str:
+    """
+    Summary of a whole case (its first SUMMARY_CHUNKS chunks), computed
+    once per loaded index instead of once per question. A rebuilt index
+    is a new object, so its summary is recomputed.
+    """
+    db = get_index(index_path)
+    key = tuple(sorted(doc_ids)) if doc_ids else ()
+
+    summaries = _case_summaries.setdefault(db, {})
+    if key not in summaries:
+        texts = db.document_texts(doc_ids, limit=SUMMARY_CHUNKS)
+        summaries[key], _ = condense_context([Document(page_content=t) for t in texts])
+    return summaries[key]
+
+
 # ----------------------------------------------------
 # 3. STRICT FINAL ANSWER PROMPT
 # ----------------------------------------------------
 def build_prompt(question: str, summary: str, raw_docs: str) -> str:
+    # The SUMMARY block is left out entirely when there is no summary
+    summary_block = f"\nSUMMARY:\n{summary}\n" if summary else ""
     return f"""
 You are an academic STRICT RAG answer system.
 
 RAW CONTEXT:
 {raw_docs}
-
-SUMMARY:
-{summary}
-
+{summary_block}
 QUESTION:
 {question}
 
@@ -157,17 +316,189 @@ TASK:
 # ----------------------------------------------------
 # 4. FULL RAG PIPELINE
 # ----------------------------------------------------
-def answer_query(index_path: str, query: str):
-    try:
-        docs = retrieve_docs(index_path, query, k=15)
-    except FileNotFoundError as e:
-        return str(e), []
+def prepare_answer(index_path: str, query: str, doc_ids=None, mode: str = None, docs=None):
+    """
+    Retrieval and prompt building shared by answer_query and answer_query_stream.
+    Returns (docs, prompt, message); prompt is None when there is nothing
+    to ask Gemini and message says why.
+    docs skips retrieval when the caller already has them (answer_queries).
+    """
+    docs, message = retrieve_for_answer(index_path, query, doc_ids, mode, docs)
+    if message is not None:
+        return docs, None, message
+    return docs, build_answer_prompt(index_path, query, docs, doc_ids, mode), None
+
+
+def retrieve_for_answer(index_path: str, query: str, doc_ids=None, mode: str = None, docs=None):
+    """
+    First half of prepare_answer(): (docs, message), message set when
+    there is nothing to answer from.
+    """
+    mode = mode or DEFAULT_PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode {mode!r}; expected one of {', '.join(PIPELINE_MODES)}")
+
+    if docs is None:
+        try:
+            docs = retrieve_docs(index_path, query, k=15, doc_ids=doc_ids)
+        except (FileNotFoundError, ValueError) as e:
+            return [], str(e)
 
     if not docs:
-        return "⚠️ No chunks retrieved.", []
+        return [], "⚠️ No chunks retrieved."
+    return docs, None
+
+
+def build_answer_prompt(index_path: str, query: str, docs, doc_ids=None, mode: str = None) -> str:
+    """
+    Second half of prepare_answer(). two_pass and case_summary make a
+    Gemini call of their own here.
+    """
+    mode = mode or DEFAULT_PIPELINE_MODE
+    # Overlapping chunks merged, best first, within CONTEXT_TOKEN_BUDGET
+    if mode == "two_pass":
+        summary, raw_docs = condense_context(docs, query)
+    elif mode == "case_summary":
+        summary, raw_docs = case_summary(index_path, doc_ids), pack_context(docs, query)[0]
+    else:
+        summary, raw_docs = None, pack_context(docs, query)[0]
+
+    return build_prompt(query, summary, raw_docs)
+
+
+def _semantic_lookup(index_path: str, query: str, doc_ids=None, mode: str = None):
+    """
+    Look the question up in the semantic cache of the index (see query_cache.py).
+    Returns (slot, hit): hit is a cached (answer, docs) or None, slot is what
+    _remember() needs to store a new answer (None when the cache is off).
+    """
+    return _semantic_lookup_batch(index_path, [query], doc_ids, mode)[0]
+
+
+def _semantic_lookup_batch(index_path: str, queries: List[str], doc_ids=None, mode: str = None):
+    """
+    _semantic_lookup() for many questions, embedded in one batch.
+    """
+    if not USE_SEMANTIC_CACHE or not os.path.exists(index_path):
+        return [(None, None)] * len(queries)
+    try:
+        db = get_index(index_path)
+    except ValueError:
+        # Unreadable or built with another embedding backend; retrieval reports it
+        return [(None, None)] * len(queries)
+    cache = semantic_cache_for(db)
+    scope = (tuple(sorted(doc_ids)) if doc_ids else None, mode or DEFAULT_PIPELINE_MODE)
+    return [
+        ((cache, vector, scope, query), cache.get(vector, scope, query))
+        for query, vector in zip(queries, embed_queries(db.embedding, queries))
+    ]
+
+
+def _remember(slot, answer: str, docs):
+    # Errors and empty retrievals are asked again next time
+    if slot is not None and docs and answer and not answer.startswith("⚠️"):
+        cache, vector, scope, query = slot
+        cache.put(vector, scope, answer, docs, query)
+
+
+def _answer(index_path, query, doc_ids, mode, docs, slot):
+    docs, prompt, message = prepare_answer(index_path, query, doc_ids, mode, docs)
+    if prompt is None:
+        return message, docs
 
-    summary, raw_docs = condense_context(docs)
-    prompt = build_prompt(query, summary, raw_docs)
     answer = gemini_generate(prompt, max_tokens=500)
+    _remember(slot, answer, docs)
 
     return answer, docs
+
+
+def answer_query(index_path: str, query: str, doc_ids=None, mode: str = None, docs=None):
+    slot, hit = _semantic_lookup(index_path, query, doc_ids, mode)
+    if hit is not None:
+        return hit
+    return _answer(index_path, query, doc_ids, mode, docs, slot)
+
+
+def answer_queries(
+    index_path: str, queries: List[str], doc_ids=None, mode: str = None, workers: int = None
+) -> Iterator[Tuple[int, str, List[Document]]]:
+    """
+    Answer many questions against one index. Retrieval is batched
+    (retrieve_docs_batch); the Gemini calls go through a pool of `workers`
+    threads, on top of the LLM client's own concurrency limit.
+    Yields (position in queries, answer, docs) as answers complete, so
+    callers can write results out without waiting for the slowest one.
+    Identical questions are answered once, and questions close to one
+    already answered come straight from the semantic cache.
+    """
+    queries = list(queries)
+    positions = {}
+    for i, query in enumerate(queries):
+        positions.setdefault(query, []).append(i)
+
+    # All questions embedded in one batch; retrieval below reuses the vectors
+    slots = {}
+    lookups = _semantic_lookup_batch(index_path, list(positions), doc_ids, mode)
+    for query, (slots[query], hit) in zip(list(positions), lookups):
+        if hit is not None:
+            for i in positions[query]:
+                yield i, hit[0], hit[1]
+            del slots[query]
+
+    todo = list(slots)
+    if not todo:
+        return
+    try:
+        all_docs = retrieve_docs_batch(index_path, todo, k=15, doc_ids=doc_ids)
+    except (FileNotFoundError, ValueError) as e:
+        for query in todo:
+            for i in positions[query]:
+                yield i, str(e), []
+        return
+
+    with ThreadPoolExecutor(max_workers=workers or BATCH_WORKERS) as pool:
+        futures = {
+            pool.submit(_answer, index_path, query, doc_ids, mode, docs, slots[query]): query
+            for query, docs in zip(todo, all_docs)
+        }
+        for future in as_completed(futures):
+            answer, docs = future.result()
+            for i in positions[futures[future]]:
+                yield i, answer, docs
+
+
+def answer_query_stream(
+    index_path: str, query: str, doc_ids=None, mode: str = None
+) -> Tuple[List[Document], Iterator[str]]:
+    """
+    Retrieves right away and returns (docs, token_stream), so callers can
+    show the sources while the answer is still being generated.
+    A question close to one already answered is served from the semantic cache.
+    """
+    slot, hit = _semantic_lookup(index_path, query, doc_ids, mode)
+    if hit is not None:
+        answer, docs = hit
+        return docs, iter([answer])
+
+    docs, message = retrieve_for_answer(index_path, query, doc_ids, mode)
+    if message is not None:
+        return docs, iter([message])
+
+    # The summary call of two_pass / case_summary waits for the first read
+    pieces = _generate_stream(index_path, query, docs, doc_ids, mode)
+    return docs, _remember_stream(pieces, slot, docs)
+
+
+def _generate_stream(index_path, query, docs, doc_ids, mode) -> Iterator[str]:
+    prompt = build_answer_prompt(index_path, query, docs, doc_ids, mode)
+    yield from gemini_generate_stream(prompt, max_tokens=500)
+
+
+def _remember_stream(pieces: Iterator[str], slot, docs) -> Iterator[str]:
+    # Pass the pieces through; cache the whole answer once it has streamed
+    seen = []
+    for piece in pieces:
+        seen.append(piece)
+        yield piece
+    if not any(p.startswith("⚠️") for p in seen):
+        _remember(slot, "".join(seen).strip(), docs)
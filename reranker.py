@@ -0,0 +1,131 @@
+# reranker.py — second retrieval stage: cross-encoder reranking on CPU
+#
+# The bi-encoder ranks chunks by comparing two separately computed vectors,
+# so retrieval sends k=15 chunks to Gemini to be safe. With RERANK=1,
+# retrieval first recalls RERANK_CANDIDATES chunks cheaply (faiss + BM25,
+# without MMR), then a cross-encoder reads each (question, chunk) pair
+# together and only the RERANK_TOP_K best go into the prompt. The model is
+# downloaded and loaded on the first query.
+#
+# The cross-encoder runs on CPU in batches. RERANK_BACKEND=onnx runs it on
+# ONNX Runtime through sentence-transformers, and RERANK_ONNX_FILE picks a
+# quantized export, e.g. onnx/model_qint8_avx512.onnx. The stage is off by
+# default (RERANK=0): retrieval stays single stage.
+
+import os
+import threading
+import time
+
+import numpy as np
+
+
+USE_RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# "torch" or "onnx"
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")
+# ONNX file inside the model repo; empty = the default onnx/model.onnx
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "")
+# First stage recall, and how many chunks survive the rerank
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "6"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+
+# Built on first use by get_reranker(); importing this module stays cheap
+_reranker = None
+_reranker_lock = threading.Lock()
+
+# Running totals per retrieval stage, for the UI
+_stage_stats = {"queries": 0, "recall_ms": 0.0, "rerank_ms": 0.0, "candidates": 0}
+_stage_stats_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Shared CrossEncoder, created once per process.
+    """
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+
+                kwargs = {"device": "cpu"}
+                if RERANK_BACKEND == "onnx":
+                    kwargs["backend"] = "onnx"
+                    if RERANK_ONNX_FILE:
+                        kwargs["model_kwargs"] = {"file_name": RERANK_ONNX_FILE}
+                _reranker = CrossEncoder(RERANK_MODEL_NAME, **kwargs)
+    return _reranker
+
+
+def set_reranker(model):
+    """
+    Replace the shared cross-encoder (tests, benchmarks); anything with
+    predict(pairs, batch_size=...) returning one score per pair works.
+    """
+    global _reranker
+    _reranker = model
+
+
+def rerank_batch(queries, candidates, top_k: int = None, model=None):
+    """
+    candidates[i] is the Document list recalled for queries[i]. Every
+    (question, chunk) pair is scored in one batched predict() call.
+    Returns the top_k documents per query, best first.
+    """
+    top_k = top_k or RERANK_TOP_K
+    model = model or get_reranker()
+    pairs = [(query, doc.page_content) for query, docs in zip(queries, candidates) for doc in docs]
+    if not pairs:
+        return [[] for _ in candidates]
+
+    scores = np.asarray(
+        model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False), dtype=np.float32
+    ).ravel()
+
+    results, offset = [], 0
+    for docs in candidates:
+        own = scores[offset : offset + len(docs)]
+        offset += len(docs)
+        order = np.argsort(-own, kind="stable")[:top_k]
+        results.append([docs[i] for i in order])
+    return results
+
+
+def rerank(query, docs, top_k: int = None):
+    return rerank_batch([query], [docs], top_k)[0]
+
+
+def two_stage(queries, recall, top_k: int = None):
+    """
+    recall(queries, k) -> one Document list per query (the first stage).
+    Recalls RERANK_CANDIDATES per query, reranks them, and records how long
+    each stage took.
+    """
+    start = time.perf_counter()
+    candidates = recall(queries, RERANK_CANDIDATES)
+    recalled = time.perf_counter()
+    results = rerank_batch(queries, candidates, top_k)
+    done = time.perf_counter()
+
+    with _stage_stats_lock:
+        _stage_stats["queries"] += len(queries)
+        _stage_stats["recall_ms"] += (recalled - start) * 1000
+        _stage_stats["rerank_ms"] += (done - recalled) * 1000
+        _stage_stats["candidates"] += sum(len(docs) for docs in candidates)
+    return results
+
+
+def rerank_stats():
+    """
+    Mean milliseconds per query spent in each stage since the process started.
+    """
+    with _stage_stats_lock:
+        stats = dict(_stage_stats)
+    n = stats["queries"] or 1
+    return {
+        "queries": stats["queries"],
+        "recall_ms": round(stats["recall_ms"] / n, 1),
+        "rerank_ms": round(stats["rerank_ms"] / n, 1),
+        "candidates": round(stats["candidates"] / n, 1),
+    }
@@ -0,0 +1,143 @@
+# sparse_index.py — BM25 keyword index stored next to the faiss index
+#
+# Dense embeddings are good at paraphrases but can miss the one chunk that
+# contains an exact term ("exclusivity", a model name, a figure). A BM25
+# inverted index finds those cheaply; rrf_fuse() merges both rankings.
+#
+# Saved as one file in the index directory:
+#   bm25.npz   terms (sorted), term offsets into postings, posting rows,
+#              term frequencies, and per-chunk token counts
+
+import math
+import os
+import re
+
+import numpy as np
+
+
+BM25_FILE = "bm25.npz"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal rank fusion constant (the usual 60 from the RRF paper)
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his how i if in into is it its "
+    "of on or our she that the their them they this to was we were what when where which "
+    "who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index in CSR form: the postings of terms[i] are
+    rows[offsets[i]:offsets[i + 1]] with frequencies tfs[same slice].
+    """
+
+    def __init__(self, terms, offsets, rows, tfs, doc_len):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self._term_ids = {t: i for i, t in enumerate(terms.tolist())}
+        self._avg_len = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    @classmethod
+    def from_texts(cls, texts):
+        postings = {}
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[row] = len(tokens)
+            counts = {}
+            for t in tokens:
+                counts[t] = counts.get(t, 0) + 1
+            for t, tf in counts.items():
+                postings.setdefault(t, []).append((row, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        flat = [p for t in terms for p in postings[t]]
+        rows = np.array([p[0] for p in flat], dtype=np.int32)
+        tfs = np.array([p[1] for p in flat], dtype=np.float32)
+        return cls(np.array(terms, dtype=str), offsets, rows, tfs, doc_len)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Load bm25.npz from an index directory, or None if it has none
+        (indexes saved before keyword search existed).
+        """
+        file = os.path.join(path, BM25_FILE)
+        if not os.path.exists(file):
+            return None
+        with np.load(file) as data:
+            return cls(data["terms"], data["offsets"], data["rows"], data["tfs"], data["doc_len"])
+
+    def save(self, path):
+        np.savez(
+            os.path.join(path, BM25_FILE),
+            terms=self.terms, offsets=self.offsets, rows=self.rows, tfs=self.tfs, doc_len=self.doc_len,
+        )
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def search_rows(self, query, k: int = 4, rows=None):
+        """
+        Returns [(score, row)] best first, only rows with a positive score.
+        `rows` optionally restricts the search to a list of (start, end) ranges.
+        """
+        n = len(self)
+        term_ids = {self._term_ids[t] for t in tokenize(query) if t in self._term_ids}
+        if n == 0 or not term_ids:
+            return []
+
+        scores = np.zeros(n, dtype=np.float32)
+        for i in term_ids:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            hit_rows = self.rows[start:end]
+            tf = self.tfs[start:end]
+            idf = math.log(1.0 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_len[hit_rows] / self._avg_len)
+            scores[hit_rows] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+        if rows is not None:
+            allowed = np.zeros(n, dtype=bool)
+            for start, end in rows:
+                allowed[start:end] = True
+            scores[~allowed] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(float(scores[r]), int(r)) for r in candidates]
+
+
+def rrf_scores(rankings, rrf_k: int = RRF_K):
+    """
+    Reciprocal rank fusion: each key scores sum(1 / (rrf_k + rank)) over
+    the rankings it appears in. Returns [(key, score)] best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def rrf_fuse(rankings, k: int = None, rrf_k: int = RRF_K):
+    """
+    Keys of rrf_scores() best first (top k).
+    """
+    fused = [key for key, _ in rrf_scores(rankings, rrf_k)]
+    return fused if k is None else fused[:k]
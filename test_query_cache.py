@@ -0,0 +1,26 @@
+import numpy as np
+
+from query_cache import SemanticCache, key_terms
+
+
+def test_key_terms_keep_numbers_and_names():
+    assert key_terms("What was revenue in 2019?") == {"2019"}
+    assert key_terms("What did Ferrari agree with Shell?") == {"ferrari", "shell"}
+
+
+def test_questions_differing_in_a_year_do_not_share_an_answer():
+    # Embedding models put these two almost on top of each other
+    vector = np.ones(8, dtype=np.float32)
+    cache = SemanticCache(threshold=0.95)
+    cache.put(vector, "scope", "Revenue was $1.2M.", ["doc"], "What was revenue in 2019?")
+
+    assert cache.get(vector, "scope", "What was revenue in 2020?") is None
+    assert cache.get(vector, "scope", "what was the revenue in 2019") == ("Revenue was $1.2M.", ["doc"])
+
+
+def test_questions_differing_in_a_party_do_not_share_an_answer():
+    vector = np.ones(8, dtype=np.float32)
+    cache = SemanticCache(threshold=0.95)
+    cache.put(vector, "scope", "Exclusivity for five years.", ["doc"], "What did Ferrari agree with Shell?")
+
+    assert cache.get(vector, "scope", "What did Ferrari agree with Puma?") is None
@@ -1,4 +1,55 @@
+import hashlib
 import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one writer process assumed
+    fcntl = None
 
 def get_file_size(path):
     return round(os.path.getsize(path) / 1024, 2)
+
+
+def file_sha256(path, block_size=1 << 20):
+    """
+    Hex SHA-256 of a file's contents, read in blocks.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def save_stream(src, path, block_size=1 << 20):
+    """
+    Copy a file-like object to path block by block, hashing on the way,
+    so the whole file is never held in memory a second time.
+    Returns the hex SHA-256 of what was written.
+    """
+    h = hashlib.sha256()
+    if hasattr(src, "seek"):
+        src.seek(0)
+    with open(path, "wb") as f:
+        for block in iter(lambda: src.read(block_size), b""):
+            h.update(block)
+            f.write(block)
+    return h.hexdigest()
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive advisory lock on path (created if missing), held for the
+    with block. Serializes writers across processes, e.g. the app's
+    indexing jobs and preprocess_cases.py on the same collection.
+    """
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)